@@ -0,0 +1,96 @@
+"""
+大整数运算后端
+安装了gmpy2时使用GMP实现, 否则使用纯Python实现
+可通过环境变量CRYPTO_BIGINT_BACKEND指定: auto(默认) / gmpy2 / python
+所有函数的返回值均为Python int, 不可逆时invert抛出ValueError, 与pow(x, -1, m)一致
+to_native将int转换为后端的原生整数类型, 供需要自己做大量乘法的代码(如预计算表)使用
+"""
+import os
+
+import sympy
+
+BACKEND_ENV = "CRYPTO_BIGINT_BACKEND"
+
+
+def _python_backend():
+    def powmod(x: int, y: int, m: int) -> int:
+        return pow(x, y, m)
+
+    def invert(x: int, m: int) -> int:
+        return pow(x, -1, m)
+
+    def next_prime(n: int) -> int:
+        return int(sympy.nextprime(n))
+
+    def is_prime(n: int) -> bool:
+        return bool(sympy.isprime(n))
+
+    return "python", powmod, invert, next_prime, is_prime, int
+
+
+def _gmpy2_backend():
+    import gmpy2
+
+    def powmod(x: int, y: int, m: int) -> int:
+        try:
+            return int(gmpy2.powmod(x, y, m))
+        except ZeroDivisionError as e:
+            raise ValueError(str(e))
+
+    def invert(x: int, m: int) -> int:
+        try:
+            return int(gmpy2.invert(x, m))
+        except ZeroDivisionError:
+            raise ValueError("base is not invertible for the given modulus")
+
+    def next_prime(n: int) -> int:
+        return int(gmpy2.next_prime(n))
+
+    def is_prime(n: int) -> bool:
+        return bool(gmpy2.is_prime(n))
+
+    return "gmpy2", powmod, invert, next_prime, is_prime, gmpy2.mpz
+
+
+def _select_backend():
+    choice = os.environ.get(BACKEND_ENV, "auto").lower()
+    if choice == "python":
+        return _python_backend()
+    if choice == "gmpy2":
+        return _gmpy2_backend()
+    if choice != "auto":
+        raise ValueError("{}的取值只能是auto, gmpy2或python".format(BACKEND_ENV))
+    try:
+        return _gmpy2_backend()
+    except ImportError:
+        return _python_backend()
+
+
+BACKEND, powmod, invert, next_prime, is_prime, to_native = _select_backend()
+
+
+def test():
+    backends = [_python_backend()]
+    try:
+        backends.append(_gmpy2_backend())
+    except ImportError:  # gmpy2是可选依赖
+        pass
+    for backend in backends:
+        _, _powmod, _invert, _next_prime, _is_prime, _to_native = backend
+        assert _powmod(3, 200, 1000003) == pow(3, 200, 1000003)
+        assert _powmod(3, -1, 7) == 5
+        assert _invert(3, 7) == 5
+        try:
+            _invert(2, 4)
+            assert False
+        except ValueError:
+            pass
+        assert _next_prime(13) == 17
+        assert _is_prime(2 ** 127 - 1) and not _is_prime(2 ** 128 + 1)
+        assert type(_powmod(2, 10, 1000)) is int
+        assert int(_to_native(7) * _to_native(6) % _to_native(5)) == 2
+
+
+if __name__ == '__main__':
+    test()
+    print("backend:", BACKEND)
@@ -0,0 +1,152 @@
+"""
+DLP实验归档模式
+实验结束后任务表不再变化, 设置环境变量DLP_ARCHIVE后, 启动时把全部任务读入内存中的只读索引(以规范化的g为键),
+所有DLP查询接口都直接从索引中返回, 写接口一律拒绝, 服务器无需连接数据库
+- DLP_ARCHIVE=<文件路径>: 从导出的文件读取, 完全不连接数据库
+- DLP_ARCHIVE=db: worker启动时(preload_archive)从Task表读取一次, 之后不再访问数据库
+
+导出:
+    python -m app.main.dlp.archive dlp_archive.jsonl
+"""
+import argparse
+import json
+import os
+import threading
+
+ARCHIVE_ENV = "DLP_ARCHIVE"
+FIELDS = ("id", "g", "p", "y", "finished", "result", "success", "operating_time")
+
+
+def normalize(value) -> str:
+    """十进制整数的规范形式, 去掉前导0"""
+    return str(int(value))
+
+
+class ArchivedTask:
+    __slots__ = FIELDS
+
+    def __init__(self, **values):
+        for name in FIELDS:
+            setattr(self, name, values.get(name))
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in FIELDS}
+
+
+class TaskArchive:
+    def __init__(self, tasks):
+        self._by_id = {}
+        self._by_g = {}  # 规范化的g -> 编号最小的cado-nfs任务(p为空), 与get_task的查询一致
+        self._by_instance = {}  # (g, p, y) -> 任务
+        for task in sorted(tasks, key=lambda t: t.id):
+            self._by_id[task.id] = task
+            g = normalize(task.g)
+            if task.p is None:
+                self._by_g.setdefault(g, task)
+            else:
+                self._by_instance.setdefault((g, normalize(task.p), normalize(task.y)), task)
+
+        unfinished = [task.id for task in self._by_id.values() if not task.finished]
+        self.task_count = len(self._by_id)
+        self.not_finished_count = len(unfinished)
+        self.head_task_id = min(unfinished) if unfinished else None
+
+    def __len__(self):
+        return self.task_count
+
+    def get(self, g: str, p: str = None, y: str = None):
+        if p is None:
+            return self._by_g.get(normalize(g))
+        return self._by_instance.get((normalize(g), normalize(p), normalize(y)))
+
+    def get_by_id(self, task_id: int):
+        return self._by_id.get(task_id)
+
+    @classmethod
+    def from_file(cls, path: str):
+        with open(path) as f:
+            return cls(ArchivedTask(**json.loads(line)) for line in f if line.strip())
+
+    @classmethod
+    def from_database(cls):
+        from database.models import Task
+
+        return cls(ArchivedTask(**{name: getattr(task, name) for name in FIELDS}) for task in Task.query.all())
+
+    def dump(self, path: str):
+        tmp_path = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp_path, "w") as f:
+            for task in self._by_id.values():
+                f.write(json.dumps(task.to_dict(), ensure_ascii=False) + "\n")
+        os.replace(tmp_path, path)
+
+
+_archive = None
+_archive_lock = threading.Lock()
+
+
+def get_archive():
+    """未开启归档模式时返回None"""
+    global _archive
+    source = os.environ.get(ARCHIVE_ENV)
+    if not source:
+        return None
+    if _archive is None:
+        with _archive_lock:
+            if _archive is None:
+                _archive = TaskArchive.from_database() if source == "db" else TaskArchive.from_file(source)
+    return _archive
+
+
+def preload_archive(app):
+    """
+    在worker启动时加载归档, 不让第一个请求等待Task.query.all()
+    从数据库读取失败(例如执行flask db upgrade时表还不存在)时退回到第一次使用时加载
+    """
+    from sqlalchemy.exc import SQLAlchemyError
+
+    with app.app_context():
+        try:
+            get_archive()
+        except SQLAlchemyError:
+            pass
+
+
+# 从文件读取时在导入时就加载, 文件有误时尽早失败
+if os.environ.get(ARCHIVE_ENV) not in (None, "", "db"):
+    get_archive()
+
+
+def test():
+    import tempfile
+
+    tasks = [ArchivedTask(id=3, g="0012", finished=False, success=False),
+             ArchivedTask(id=1, g="12", finished=True, result="7", success=True, operating_time=5),
+             ArchivedTask(id=2, g="5", p="23", y="010", finished=True, result="3", success=True),
+             ArchivedTask(id=4, g="5", finished=False, success=False)]
+    archive = TaskArchive(tasks)
+    assert archive.get("012").id == 1 and archive.get("5").id == 4 and archive.get("6") is None
+    assert archive.get("5", "23", "10").id == 2 and archive.get("5", "23", "11") is None
+    assert (archive.task_count, archive.not_finished_count, archive.head_task_id) == (4, 2, 3)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "archive.jsonl")
+        archive.dump(path)
+        loaded = TaskArchive.from_file(path)
+        assert loaded.get_by_id(1).to_dict() == archive.get_by_id(1).to_dict() and len(loaded) == 4
+
+
+def main():
+    from app_wrapper import app
+
+    parser = argparse.ArgumentParser(description="导出DLP任务表, 供归档模式使用")
+    parser.add_argument("output", help="导出文件路径")
+    args = parser.parse_args()
+    with app.app_context():
+        archive = TaskArchive.from_database()
+    archive.dump(args.output)
+    print("dumped {} tasks to {}".format(len(archive), args.output))
+
+
+if __name__ == '__main__':
+    main()
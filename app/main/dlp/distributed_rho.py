@@ -0,0 +1,173 @@
+"""
+分布式Pollard rho
+多台计算机在同一个任务上并行游走, 只把可区分点(x, a, b)批量上报给服务器; 服务器把点存入按(task_id, x)索引的表中,
+不同计算机(或同一计算机的不同游走)到达同一个可区分点时即可求出对数, 速度随计算机数量近似线性增长
+
+协议:
+1. GET  /crypto/dlp/rho/<task_id>/params  取得游走函数的定义(RhoWalk.to_definition)
+2. 各计算机从随机的(a, b)出发, 按定义游走, 每遇到一个可区分点就从新的随机起点重新开始
+3. POST /crypto/dlp/rho/<task_id>/points  批量上报可区分点, 返回任务是否已经解出
+
+游走只在g的阶中最大的素因子q对应的子群上进行, 其余(光滑的)部分由服务器用Pohlig-Hellman求出, 最后用CRT合并
+"""
+import json
+import random
+import time
+import urllib.request
+from functools import lru_cache
+
+from app.main.arith import is_prime, powmod
+from app.main.dlp.solver import (TIME_BUDGET, BSGS_MAX_ORDER, RhoWalk, crt, element_order, factorize,
+                                 pohlig_hellman)
+from app.main.pool import POOL_WORKERS, get_process_pool
+
+# 每次上报的可区分点个数
+POINTS_PER_BATCH = 16
+
+
+class RhoSetup:
+    """
+    将g^x = y (mod p)拆成两部分: 素数阶q子群上的对数(分布式rho), 和阶为cofactor的光滑部分(服务器直接求出)
+    """
+
+    def __init__(self, p: int, g: int, y: int, walk_seed: int = 0, time_budget: float = TIME_BUDGET):
+        deadline = time.monotonic() + time_budget
+        order, order_factors = element_order(g % p, p, factorize(p - 1, deadline))
+        if powmod(y, order, p) != 1:
+            raise ValueError("y不在g生成的子群中, 无解")
+        q = max(order_factors)
+        if order_factors[q] != 1:
+            raise ValueError("g的阶的最大素因子的指数大于1, 不支持分布式求解")
+        if q <= BSGS_MAX_ORDER:
+            raise ValueError("g的阶的素因子都较小, 可以直接在本地求解")
+
+        self.p, self.g, self.y = p, g, y
+        self.order, self.q = order, q
+        self.cofactor = order // q
+        cofactor_factors = {f: e for f, e in order_factors.items() if f != q}
+        self.x_cofactor = pohlig_hellman(powmod(g, q, p), powmod(y, q, p), p, self.cofactor, cofactor_factors,
+                                         deadline)
+        self.walk = RhoWalk(p, powmod(g, self.cofactor, p), powmod(y, self.cofactor, p), q, walk_seed)
+
+    def solve_collision(self, a1: int, b1: int, a2: int, b2: int):
+        """由两个相同的可区分点求出完整的对数, 退化的碰撞返回None"""
+        x_q = self.walk.solve_collision(a1, b1, a2, b2)
+        if x_q is None:
+            return None
+        return crt([self.x_cofactor, x_q], [self.cofactor, self.q])
+
+
+@lru_cache(maxsize=32)
+def rho_setup(p: int, g: int, y: int, walk_seed: int = 0) -> RhoSetup:
+    """同一任务的拆分结果在进程内缓存, 避免每次请求都重新分解p-1"""
+    return RhoSetup(p, g, y, walk_seed)
+
+
+def walk_until_points(definition: dict, seed: int, count: int = POINTS_PER_BATCH, time_budget: float = 10.0) -> list:
+    """
+    计算机一侧: 按定义游走, 收集至多count个可区分点, 或直到时间用完
+    返回[(x, a, b), ...]
+    """
+    walk = RhoWalk.from_definition(definition)
+    rng = random.Random(seed)
+    deadline = time.monotonic() + time_budget
+    max_walk = 20 << walk.dp_bits
+    points = []
+    x, a, b = walk.start(rng)
+    walked = 0
+    while len(points) < count and time.monotonic() < deadline:
+        x, a, b, distinguished = walk.run(x, a, b, 4096)
+        walked += 4096
+        if distinguished:
+            points.append((x, a, b))
+        if distinguished or walked > max_walk:
+            x, a, b = walk.start(rng)
+            walked = 0
+    return points
+
+
+def run_local(p: int, g: int, y: int, processes: int = POOL_WORKERS, time_budget: float = 600.0):
+    """
+    在本机用多个进程模拟多台计算机, 与服务器使用同样的拆分和碰撞检测, 用于测试
+    返回对数, 超时返回None
+    """
+    setup = RhoSetup(p, g, y)
+    definition = setup.walk.to_definition()
+    points = {}  # x -> (a, b)
+    deadline = time.monotonic() + time_budget
+    pool = get_process_pool()
+    seeds = iter(range(1, 1 << 62))
+    futures = [pool.submit(walk_until_points, definition, next(seeds)) for _ in range(processes)]
+    try:
+        while time.monotonic() < deadline:
+            future = futures.pop(0)
+            for x, a, b in future.result():
+                if x in points:
+                    result = setup.solve_collision(*points[x], a, b)
+                    if result is not None:
+                        return result
+                points[x] = (a, b)
+            futures.append(pool.submit(walk_until_points, definition, next(seeds)))
+        return None
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def work_remote(server: str, task_id: int, token: str, worker: str, processes: int = POOL_WORKERS):
+    """
+    实验室计算机一侧: 从服务器取得游走定义, 用多个进程游走并上报可区分点, 直到任务解出
+    """
+    base = "{}/crypto/dlp/rho/{}".format(server.rstrip("/"), task_id)
+    with urllib.request.urlopen(base + "/params") as response:
+        params = json.load(response)
+    if not params.get("success"):
+        raise ValueError(params.get("reason"))
+    if params.get("finished"):
+        return params.get("result")
+
+    pool = get_process_pool()
+    rng = random.SystemRandom()
+    futures = [pool.submit(walk_until_points, params["walk"], rng.getrandbits(64)) for _ in range(processes)]
+    while True:
+        future = futures.pop(0)
+        points = [dict(x=str(x), a=str(a), b=str(b)) for x, a, b in future.result()]
+        request = urllib.request.Request(base + "/points",
+                                         data=json.dumps(dict(token=token, worker=worker, points=points)).encode(),
+                                         headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request) as response:
+            result = json.load(response)
+        if not result.get("success"):
+            raise ValueError(result.get("reason"))
+        if result.get("finished"):
+            for pending in futures:
+                pending.cancel()
+            return result.get("result")
+        futures.append(pool.submit(walk_until_points, params["walk"], rng.getrandbits(64)))
+
+
+def test():
+    # p - 1 = 2 * 3 * 5 * 7 * q * k, q约为2^44
+    q = 17592186044423
+    assert is_prime(q)
+    k = 2 * 3 * 5 * 7
+    while not is_prime(k * q + 1):
+        k += 2 * 3 * 5 * 7
+    p = k * q + 1
+    g = next(h for h in range(2, 100) if element_order(h, p, factorize(p - 1))[0] == p - 1)
+    x = 12345678901234567 % (p - 1)
+    y = powmod(g, x, p)
+
+    setup = RhoSetup(p, g, y)
+    walk = RhoWalk.from_definition(json.loads(json.dumps(setup.walk.to_definition())))
+    assert walk.multipliers == setup.walk.multipliers
+    points = walk_until_points(setup.walk.to_definition(), seed=1, count=2)
+    assert points and all(setup.walk.is_valid_point(*point) for point in points)
+    assert not setup.walk.is_valid_point(points[0][0], points[0][1] + 1, points[0][2])
+
+    result = run_local(p, g, y, processes=4, time_budget=300)
+    assert result == x
+
+
+if __name__ == '__main__':
+    test()
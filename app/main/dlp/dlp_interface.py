@@ -1,13 +1,32 @@
+import datetime
+import functools
+import json
+import queue
 import time
 
-from flask import request, jsonify
+from flask import request, jsonify, Response, stream_with_context
 from flask_cors import cross_origin
 
 from app.main import main
-from app.main.tools import hex2
+from app.main.arith import powmod
+from app.main.dlp.archive import get_archive
+from app.main.tools import hex2, MAX_BATCH_SIZE
 from server_secrets import LAB_COMPUTER_TOKEN
 
 
+ARCHIVED_REASON = "DLP实验已经归档, 服务器处于只读模式"
+
+
+def reject_when_archived(view):
+    """归档模式下拒绝会修改任务的接口"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if get_archive() is not None:
+            return jsonify(success=False, reason=ARCHIVED_REASON)
+        return view(*args, **kwargs)
+    return wrapper
+
+
 @main.route('/crypto/pow_mod', methods=["POST"])
 @cross_origin()
 def calc_pow_mod():
@@ -30,7 +49,7 @@ def calc_pow_mod():
         x = int(x)
         y = int(y)
         z = int(z)
-        rslt = pow(x, y, z)
+        rslt = powmod(x, y, z)
         result_dec = str(rslt)
         result_hex = hex2(rslt)
         return jsonify(success=True, result_dec=result_dec, result_hex=result_hex)
@@ -47,6 +66,10 @@ def publish_task():
     method: POST
     表单：
     -g: 底数
+    -p, y: 素数模数和真数(可选), 同时给出时若实例较简单(p-1光滑或x范围较小), 直接在服务器上求解;
+           否则创建一个分布式rho任务, 由实验室计算机通过/crypto/dlp/rho/<task_id>/...协作求解
+    -token: 实验室计算机的token, 创建分布式rho任务时需要
+    -bound: 已知x < bound(可选), 在bound内确认无解时不保存任务, 返回的task_id为null
     返回：json
     - success: 是否成功
     - new_task: 是否是新任务
@@ -58,7 +81,7 @@ def publish_task():
     """
     # FOR DATABASE
     from database.models import Task
-    from app_wrapper import db
+    from app.main.dlp.notify import enqueue_task
 
     g = request.form.get('g')
 
@@ -68,7 +91,20 @@ def publish_task():
     if not g.isdigit():
         return jsonify(success=False, reason="g不是十进制整数")
 
-    task = Task.query.filter(Task.g == g).first()
+    p, y, bound = request.form.get('p'), request.form.get('y'), request.form.get('bound')
+    if (p is None) != (y is None):
+        return jsonify(success=False, reason="p和y需要同时指定")
+    for name, value in (("p", p), ("y", y), ("bound", bound)):
+        if value is not None and not value.isdigit():
+            return jsonify(success=False, reason="{}不是十进制整数".format(name))
+
+    archive = get_archive()
+    if archive is not None:
+        task = archive.get(g, p, y)
+    elif p is None:
+        task = Task.query.filter(Task.g == g, Task.p == None).first()
+    else:
+        task = Task.query.filter(Task.g == g, Task.p == p, Task.y == y).first()
     if task:
         return jsonify(success=True,
                        new_task=False,
@@ -78,16 +114,84 @@ def publish_task():
                        result=task.result,
                        task_success=task.success)
 
+    if p is not None and archive is None:
+        from app.main.arith import is_prime
+        from app.main.dlp.distributed_rho import rho_setup
+        from app.main.dlp.solver import DLPTimeout
+
+        g_int, p_int, y_int = int(g), int(p), int(y)
+        if p_int < 3 or not is_prime(p_int):
+            return jsonify(success=False, reason="p不是奇素数")
+
+        task = solve_locally(g_int, p_int, y_int, int(bound) if bound is not None else None)
+        if task is not None:
+            return jsonify(success=True,
+                           new_task=task.id is not None,
+                           task_id=task.id,
+                           g=g,
+                           finished=task.finished,
+                           result=task.result,
+                           task_success=task.success)
+
+        # 分布式任务会占用实验室计算机, 只有持有token才能创建
+        token = request.form.get('token')
+        if token is None or token != LAB_COMPUTER_TOKEN:
+            return jsonify(success=False, reason="该实例无法在服务器上直接求解, 创建分布式rho任务需要token")
+        try:
+            rho_setup(p_int, g_int, y_int)  # 确认实例能够分布式求解, 顺便为之后的/params预热缓存
+        except DLPTimeout:
+            return jsonify(success=False, reason="无法在时间预算内分解p-1, 不支持分布式求解")
+        except ValueError as e:
+            return jsonify(success=False, reason=str(e))
+
+        new_task = enqueue_task(Task(g=g, p=p, y=y))
+        return jsonify(success=True,
+                       new_task=True,
+                       task_id=new_task.id,
+                       g=g,
+                       finished=False,
+                       result=None,
+                       task_success=False)
+
     # 实验已经结束, 不能再发布新任务
     return jsonify(success=False, reason="DLP实验已经结束, 为了节省计算资源, cado-nfs计算功能已经关闭!")
-    # new_task = Task(g=g)
-    # db.session.add(new_task)
-    # db.session.commit()
+    # new_task = enqueue_task(Task(g=g))
     # return jsonify(success=True,
     #                new_task=True,
     #                task_id=new_task.id)
 
 
+def solve_locally(g: int, p: int, y: int, bound=None):
+    """
+    在时间预算内于本地求解, 成功(包括确认无解)时写入一个已完成的任务并返回, 超时返回None; p须为奇素数
+    给定bound时的"无解"只说明bound内无解, 不能作为该实例的答案缓存, 返回的任务不写入数据库(id为None)
+    """
+    from database.models import Task
+    from app_wrapper import db
+    from app.main.dlp.solver import DLPTimeout, solve_in_pool
+    from app.main.dlp.stats import record_task_added
+
+    start = time.time()
+    try:
+        x = solve_in_pool(p, g, y, bound)
+    except DLPTimeout:
+        return None
+    task = Task(g=str(g),
+                p=str(p),
+                y=str(y),
+                finished=True,
+                success=x is not None,
+                result=str(x) if x is not None else "无解",
+                operating_time=int(time.time() - start),
+                claimed_by="local")
+    if x is None and bound is not None:
+        return task
+    db.session.add(task)
+    record_task_added(task)
+    db.session.commit()
+    return task
+
+
 @main.route('/crypto/dlp/get_task', methods=["GET"])
 @cross_origin()
 def get_task():
@@ -115,7 +219,8 @@ def get_task():
     if not g.isdigit():
         return jsonify(success=False, reason="g不是十进制整数")
 
-    task = Task.query.filter(Task.g == g).first()
+    archive = get_archive()
+    task = archive.get(g) if archive is not None else Task.query.filter(Task.g == g, Task.p == None).first()
     if task:
         return jsonify(success=True,
                        task_id=task.id,
@@ -129,34 +234,140 @@ def get_task():
 
 @main.route('/crypto/dlp/pick_task', methods=["GET"])
 @cross_origin()
+@reject_when_archived
 def pick_task():
     """
-    获取DLP任务未完成队列中的队头任务
+    领取DLP任务未完成队列中的队头任务
+    同一任务在租约有效期内不会被其他计算机领取, 计算过程中需通过/crypto/dlp/heartbeat续约
     method: GET
-    参数：无
+    参数：
+    -worker: 计算机标识(可选, 默认为请求的IP地址)
     返回：json
     - task_id: 任务编号
     - g: 底数
+    - lease_expires_at: 租约到期时间(UTC, ISO 8601)
+    - lease_seconds: 租约时长(秒)
     :return:
     """
-    token = request.form.get('token')
+    token = request.values.get('token')
     if token is None or token != LAB_COMPUTER_TOKEN:
         return jsonify(success=False, reason="token鉴权失败")
 
     # FOR DATABASE
-    from database.models import Task
+    from app.main.dlp.task_queue import claim_task, LEASE_SECONDS
 
-    task = Task.query.filter(Task.finished == False).first()
+    worker = request.values.get('worker') or request.remote_addr
+    task = claim_task(worker)
     if task:
         return jsonify(success=True,
                        task_id=task.id,
-                       g=task.g)
+                       g=task.g,
+                       lease_expires_at=task.lease_expires_at.isoformat(),
+                       lease_seconds=LEASE_SECONDS)
 
     return jsonify(success=False, reason="没有未完成的任务")
 
 
+
+# 长轮询最多等待的时间(秒)
+MAX_CLAIM_WAIT = 60
+
+
+@main.route('/crypto/dlp/claim_task', methods=["GET", "POST"])
+@cross_origin()
+@reject_when_archived
+def claim_task_long_poll():
+    """
+    长轮询领取DLP任务: 没有可领取的任务时保持连接, 有新任务发布或租约到期时立即领取并返回
+    method: GET/POST
+    参数：
+    -token: 实验室计算机的token
+    -worker: 计算机标识(可选, 默认为请求的IP地址)
+    -wait: 最多等待的秒数(可选, 默认为30, 最大为MAX_CLAIM_WAIT); 本worker挂起的长连接已满时不等待
+    返回：json, 与/crypto/dlp/pick_task相同
+    :return:
+    """
+    token = request.values.get('token')
+    if token is None or token != LAB_COMPUTER_TOKEN:
+        return jsonify(success=False, reason="token鉴权失败")
+
+    wait = request.values.get('wait', '30')
+    if not wait.isdigit():
+        return jsonify(success=False, reason="wait不是十进制整数")
+
+    # FOR DATABASE
+    from app_wrapper import db
+    from app.main.dlp.notify import task_notifier, waiter_slots
+    from app.main.dlp.task_queue import claim_task, next_lease_expiry, LEASE_SECONDS
+
+    worker = request.values.get('worker') or request.remote_addr
+    max_wait = min(int(wait), MAX_CLAIM_WAIT)
+    # 本worker挂起的长连接已满时不等待, 只尝试领取一次, 把线程留给其他请求
+    holding_slot = max_wait > 0 and waiter_slots.acquire(blocking=False)
+    deadline = time.monotonic() + (max_wait if holding_slot else 0)
+    try:
+        while True:
+            version = task_notifier.version
+            task = claim_task(worker)
+            if task:
+                return jsonify(success=True,
+                               task_id=task.id,
+                               g=task.g,
+                               lease_expires_at=task.lease_expires_at.isoformat(),
+                               lease_seconds=LEASE_SECONDS)
+
+            timeout = deadline - time.monotonic()
+            lease_expires_at = next_lease_expiry()
+            if lease_expires_at is not None:
+                timeout = min(timeout, (lease_expires_at - datetime.datetime.utcnow()).total_seconds() + 0.01)
+            db.session.rollback()  # 等待期间不占用数据库连接
+            if deadline - time.monotonic() <= 0:
+                return jsonify(success=False, reason="没有未完成的任务")
+            task_notifier.wait(version, max(timeout, 0))
+    finally:
+        if holding_slot:
+            waiter_slots.release()
+
+
+@main.route('/crypto/dlp/heartbeat', methods=["POST"])
+@cross_origin()
+@reject_when_archived
+def heartbeat():
+    """
+    为正在计算的DLP任务续约
+    method: POST
+    表单：
+    -task_id: 任务id
+    -worker: 计算机标识, 与领取时相同(可选, 默认为请求的IP地址)
+    返回：json
+    - success: 是否成功, 失败时说明租约已失效, 应放弃该任务
+    - lease_expires_at: 新的租约到期时间(UTC, ISO 8601)
+    :return:
+    """
+    token = request.form.get('token')
+    if token is None or token != LAB_COMPUTER_TOKEN:
+        return jsonify(success=False, reason="token鉴权失败")
+
+    # FOR DATABASE
+    from app.main.dlp.task_queue import renew_lease
+
+    task_id = request.form.get('task_id')
+    if task_id is None:
+        return jsonify(success=False, reason="没有指定task_id")
+
+    if not task_id.isdigit():
+        return jsonify(success=False, reason="task_id不是十进制整数")
+
+    worker = request.form.get('worker') or request.remote_addr
+    lease_expires_at = renew_lease(int(task_id), worker)
+    if lease_expires_at is None:
+        return jsonify(success=False, reason="租约已失效, 任务已完成或已被其他计算机领取")
+    return jsonify(success=True, lease_expires_at=lease_expires_at.isoformat())
+
+
 @main.route('/crypto/dlp/publish_task_result', methods=["POST"])
 @cross_origin()
+@reject_when_archived
 def publish_result():
     """
     公布DLP任务结果
@@ -166,6 +377,7 @@ def publish_result():
     -task_success: 任务是否成功
     -result: 任务结果
     -operating_time: DLP计算时间
+    -worker: 计算机标识(可选), 指定时必须与领取该任务的计算机一致
     返回：json
     - success: 是否成功
     :return:
@@ -176,7 +388,8 @@ def publish_result():
 
     # FOR DATABASE
     from database.models import Task
-    from app_wrapper import db
+    from app.main.dlp.notify import commit_task_change
+    from app.main.dlp.stats import record_task_finished
 
     task_id = request.form.get('task_id')
 
@@ -195,6 +408,10 @@ def publish_result():
     if task.finished:
         return jsonify(success=False,
                        reason="该任务已经结束")
+    worker = request.form.get('worker')
+    if worker is not None and task.claimed_by is not None and worker != task.claimed_by:
+        return jsonify(success=False,
+                       reason="该任务已被其他计算机领取")
 
     task_success_str = request.form.get("task_success")
     result = request.form.get("result")
@@ -214,16 +431,232 @@ def publish_result():
     task.result = result
     task.success = task_success
     task.operating_time = operating_time
+    task.lease_expires_at = None
 
-    db.session.commit()
+    record_task_finished(task)
+    commit_task_change(task)
     return jsonify(success=True)
 
 
+
+def _rho_task(task_id: int):
+    """返回(任务, 错误信息)"""
+    from database.models import Task
+
+    task = Task.query.get(task_id)
+    if not task:
+        return None, "找不到该任务"
+    if task.p is None:
+        return None, "该任务不是分布式rho任务"
+    return task, None
+
+
+@main.route('/crypto/dlp/rho/<int:task_id>/params', methods=["GET"])
+@cross_origin()
+@reject_when_archived
+def rho_params(task_id):
+    """
+    获取分布式rho任务的游走函数定义
+    method: GET
+    返回：json
+    - success: 是否成功
+    - finished: 任务是否已经完成, 完成时附带result
+    - walk: 游走函数的定义: p, g, y, q, dp_bits, multipliers, coefficients
+            状态(x, a, b)满足x = g^a * y^b, 令j = x mod len(multipliers), 则下一步为
+            x * multipliers[j] mod p, a + coefficients[j][0], b + coefficients[j][1] (a, b模q);
+            x的低dp_bits位全为0时为可区分点
+    - points_per_batch: 建议每次上报的可区分点个数
+    :return:
+    """
+    from app.main.dlp.distributed_rho import POINTS_PER_BATCH, rho_setup
+
+    task, reason = _rho_task(task_id)
+    if task is None:
+        return jsonify(success=False, reason=reason)
+    if task.finished:
+        return jsonify(success=True, finished=True, result=task.result)
+
+    try:
+        setup = rho_setup(int(task.p), int(task.g), int(task.y))
+    except Exception as e:
+        return jsonify(success=False, reason=str(e))
+    return jsonify(success=True, finished=False, walk=setup.walk.to_definition(), points_per_batch=POINTS_PER_BATCH)
+
+
+@main.route('/crypto/dlp/rho/<int:task_id>/points', methods=["POST"])
+@cross_origin()
+@reject_when_archived
+def rho_points(task_id):
+    """
+    上报分布式rho任务的可区分点
+    method: POST
+    参数：json
+    - token: 实验室计算机的token
+    - worker: 计算机标识(可选)
+    - points: 列表, 每项包含x, a, b(十进制字符串)
+    返回：json
+    - success: 是否成功
+    - finished: 任务是否已经完成, 完成时附带result
+    - accepted: 接受的点数
+    - rejected: 不合法而被丢弃的点数
+    :return:
+    """
+    post_data = request.get_json(silent=True) or {}
+    token = post_data.get('token')
+    if token is None or token != LAB_COMPUTER_TOKEN:
+        return jsonify(success=False, reason="token鉴权失败")
+
+    # FOR DATABASE
+    from database.models import RhoPoint
+    from app_wrapper import db
+    from app.main.dlp.distributed_rho import rho_setup
+    from app.main.dlp.notify import commit_task_change
+    from app.main.dlp.stats import record_task_finished
+
+    task, reason = _rho_task(task_id)
+    if task is None:
+        return jsonify(success=False, reason=reason)
+    if task.finished:
+        return jsonify(success=True, finished=True, result=task.result, accepted=0, rejected=0)
+
+    points = post_data.get('points')
+    if not isinstance(points, list):
+        return jsonify(success=False, reason="参数points为空, 请检查")
+    if len(points) > MAX_BATCH_SIZE:
+        return jsonify(success=False, reason="单次最多上报{}个点".format(MAX_BATCH_SIZE))
+
+    try:
+        setup = rho_setup(int(task.p), int(task.g), int(task.y))
+    except Exception as e:
+        return jsonify(success=False, reason=str(e))
+
+    worker = post_data.get('worker') or request.remote_addr
+    accepted, rejected = 0, 0
+    for point in points:
+        try:
+            x, a, b = int(point['x']), int(point['a']), int(point['b'])
+        except (KeyError, TypeError, ValueError):
+            rejected += 1
+            continue
+        if not setup.walk.is_valid_point(x, a, b):
+            rejected += 1
+            continue
+        accepted += 1
+
+        for other in RhoPoint.query.filter(RhoPoint.task_id == task_id, RhoPoint.x == str(x)).all():
+            result = setup.solve_collision(int(other.a), int(other.b), a, b)
+            if result is None:
+                continue
+            first_point = RhoPoint.query.filter(RhoPoint.task_id == task_id).order_by(RhoPoint.id).first()
+            started_at = first_point.created_at if first_point else datetime.datetime.utcnow()
+            task.finished = True
+            task.success = True
+            task.result = str(result)
+            task.claimed_by = worker
+            task.operating_time = int((datetime.datetime.utcnow() - started_at).total_seconds())
+            # 任务完成后可区分点就没有用了
+            RhoPoint.query.filter(RhoPoint.task_id == task_id).delete(synchronize_session=False)
+            record_task_finished(task)
+            commit_task_change(task)
+            return jsonify(success=True, finished=True, result=task.result, accepted=accepted, rejected=rejected)
+        db.session.add(RhoPoint(task_id=task_id, x=str(x), a=str(a), b=str(b), worker=worker))
+
+    db.session.commit()
+    return jsonify(success=True, finished=False, accepted=accepted, rejected=rejected)
+
+
+# SSE连接的最长保持时间(秒), 到期后由浏览器自动重连; 与长轮询相当, 避免长期占用gthread线程
+EVENTS_MAX_SECONDS = 60
+# 没有变化时发送心跳注释的间隔(秒), 防止代理断开空闲连接
+EVENTS_KEEPALIVE_SECONDS = 15
+# 通过retry字段告诉浏览器断开后多久重连(秒)
+EVENTS_RETRY_SECONDS = 5
+
+
+def _task_status(task) -> dict:
+    return dict(task_id=task.id,
+                g=task.g,
+                finished=task.finished,
+                result=task.result,
+                task_success=task.success)
+
+
+@main.route('/crypto/dlp/tasks/<int:task_id>/events', methods=["GET"])
+@cross_origin()
+def task_events(task_id):
+    """
+    以Server-Sent Events推送DLP任务的状态, 代替反复调用/crypto/dlp/get_task
+    method: GET
+    返回：text/event-stream
+    - 连接后立即推送一次当前状态, 之后每次状态变化推送一次, 事件名为status, 数据与_task_status相同
+    - 任务完成后推送最终状态并关闭连接, 连接最长保持EVENTS_MAX_SECONDS, 之后浏览器自动重连
+    - 本worker挂起的长连接已满时只推送一次当前状态并关闭, 浏览器按retry字段稍后重连
+    :return:
+    """
+    # FOR DATABASE
+    from database.models import Task
+    from app_wrapper import db
+    from app.main.dlp.notify import task_notifier, waiter_slots
+
+    archive = get_archive()
+    task = archive.get_by_id(task_id) if archive is not None else Task.query.get(task_id)
+    if not task:
+        return jsonify(success=False, reason="找不到该任务")
+
+    def event(status: dict) -> str:
+        return "event: status\ndata: {}\n\n".format(json.dumps(status, ensure_ascii=False))
+
+    def generate():
+        yield "retry: {}\n\n".format(EVENTS_RETRY_SECONDS * 1000)
+        if not waiter_slots.acquire(blocking=False):
+            current = Task.query.get(task_id)
+            db.session.rollback()
+            if current:
+                yield event(_task_status(current))
+            return
+        # 先订阅再读取状态, 避免错过两者之间的变化
+        changes = task_notifier.subscribe(task_id)
+        try:
+            deadline = time.monotonic() + EVENTS_MAX_SECONDS
+            status = None
+            while True:
+                current = Task.query.get(task_id)
+                current_status = _task_status(current) if current else None
+                db.session.rollback()  # 等待期间不占用数据库连接
+                if current_status is None:
+                    return
+                if current_status != status:
+                    status = current_status
+                    yield event(status)
+                if status["finished"]:
+                    return
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                try:
+                    changes.get(timeout=min(EVENTS_KEEPALIVE_SECONDS, remaining))
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                while not changes.empty():  # 合并积压的通知
+                    changes.get_nowait()
+        finally:
+            task_notifier.unsubscribe(task_id, changes)
+            waiter_slots.release()
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}  # 禁止nginx缓冲
+    if archive is not None:  # 归档后状态不会再变化
+        return Response(event(_task_status(task)), mimetype="text/event-stream", headers=headers)
+    return Response(stream_with_context(generate()), mimetype="text/event-stream", headers=headers)
+
+
 @main.route('/crypto/dlp/current_task_status', methods=["GET"])
 @cross_origin()
 def current_status():
     """
     获取DLP任务未完成队列中的队头任务
+    计数由TaskStats维护, 只需读取一行
     method: GET
     参数：无
     返回：json
@@ -231,17 +664,15 @@ def current_status():
     - g: 底数
     :return:
     """
-    # FOR DATABASE
-    from database.models import Task
-
-    task_count = Task.query.count()
-    not_finished_count = Task.query.filter(Task.finished == False).count()
-    current_operating_task = Task.query.filter(Task.finished == False).first()
-    current_operating_task_id = 0
-    if current_operating_task:
-        current_operating_task_id = current_operating_task.id
-
+    archive = get_archive()
+    if archive is not None:
+        stats = archive
+    else:
+        # FOR DATABASE
+        from app.main.dlp.stats import get_stats
+
+        stats = get_stats()
     return jsonify(success=True,
-                   task_count=task_count,
-                   not_finished_count=not_finished_count,
-                   current_operating_task_id=current_operating_task_id)
+                   task_count=stats.task_count,
+                   not_finished_count=stats.not_finished_count,
+                   current_operating_task_id=stats.head_task_id or 0)
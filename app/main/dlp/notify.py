@@ -0,0 +1,151 @@
+"""
+DLP任务变化通知
+任务被插入或状态改变时, 唤醒正在等待的长轮询请求, 代替反复查询数据库:
+- 进程内: 条件变量, 同一进程内的等待者立即被唤醒(SQLite等单进程环境只用这一种)
+- 跨进程: PostgreSQL的LISTEN/NOTIFY, 每个gunicorn worker有一个监听线程, 收到通知后再唤醒本进程内的等待者
+- 订阅: 按任务编号分发到各订阅者的队列(SSE), 空闲的订阅者只是阻塞在自己的队列上, 不查询数据库
+
+长轮询和SSE在等待期间各占用一个gthread线程, 每个worker中同时挂起的长连接数由waiter_slots限制,
+其余线程留给普通请求
+"""
+import os
+import queue
+import select
+import threading
+import time
+
+from sqlalchemy import text
+
+CHANNEL = "dlp_task"
+# 监听连接断开后重连的间隔(秒)
+RECONNECT_INTERVAL = 5
+# 每个worker中同时挂起的长连接(长轮询, SSE)数上限, 应小于gunicorn的threads
+MAX_WAITERS = int(os.environ.get("DLP_MAX_WAITERS", "8"))
+
+
+class TaskNotifier:
+    def __init__(self, channel: str = CHANNEL):
+        self.channel = channel
+        self._condition = threading.Condition()
+        self._version = 0
+        self._listener_pid = None
+        self._subscribers = {}  # task_id -> {queue.Queue}
+
+    @property
+    def version(self) -> int:
+        """每次通知加1, 等待前先记下, 避免错过检查与等待之间发生的通知"""
+        return self._version
+
+    def publish(self, session, task_id: int):
+        """
+        在提交事务之前调用: PostgreSQL的NOTIFY随事务一起提交, 回滚时不会发出
+        提交后还需调用notify_local唤醒本进程内的等待者
+        """
+        if session.get_bind().dialect.name == "postgresql":
+            session.execute(text("SELECT pg_notify(:channel, :payload)"),
+                            {"channel": self.channel, "payload": str(task_id)})
+
+    def notify_local(self, task_id: int = None):
+        """task_id为None时表示不确定是哪个任务, 通知所有订阅者"""
+        with self._condition:
+            self._version += 1
+            self._condition.notify_all()
+            if task_id is None:
+                targets = [q for queues in self._subscribers.values() for q in queues]
+            else:
+                targets = list(self._subscribers.get(task_id, ()))
+        for q in targets:
+            q.put(task_id)
+
+    def subscribe(self, task_id: int) -> queue.Queue:
+        """订阅某个任务的变化, 每次变化时队列中会收到一项; 用完后需调用unsubscribe"""
+        self._ensure_listening()
+        q = queue.Queue()
+        with self._condition:
+            self._subscribers.setdefault(task_id, set()).add(q)
+        return q
+
+    def unsubscribe(self, task_id: int, q: queue.Queue):
+        with self._condition:
+            queues = self._subscribers.get(task_id)
+            if queues is not None:
+                queues.discard(q)
+                if not queues:
+                    del self._subscribers[task_id]
+
+    def wait(self, version: int, timeout: float) -> bool:
+        """等待version之后的通知, 返回是否收到"""
+        self._ensure_listening()
+        with self._condition:
+            return self._condition.wait_for(lambda: self._version != version, timeout)
+
+    def _ensure_listening(self):
+        # gunicorn的worker是fork出来的, 每个进程需要自己的监听线程
+        pid = os.getpid()
+        if self._listener_pid == pid:
+            return
+        with self._condition:
+            if self._listener_pid == pid:
+                return
+            self._listener_pid = pid
+        from app_wrapper import app, db
+        with app.app_context():
+            if db.engine.dialect.name != "postgresql":
+                return
+            engine = db.engine
+        threading.Thread(target=self._listen_loop, args=(engine,), name="dlp-task-listener", daemon=True).start()
+
+    def _listen_loop(self, engine):
+        while True:
+            try:
+                connection = engine.raw_connection()
+                try:
+                    connection.set_isolation_level(0)  # autocommit, LISTEN才会立即生效
+                    cursor = connection.cursor()
+                    cursor.execute("LISTEN {}".format(self.channel))
+                    dbapi_connection = connection.connection
+                    while True:
+                        if select.select([dbapi_connection], [], [], 60) == ([], [], []):
+                            continue
+                        dbapi_connection.poll()
+                        notifies = dbapi_connection.notifies
+                        while notifies:
+                            notify = notifies.pop(0)
+                            self.notify_local(int(notify.payload) if notify.payload.isdigit() else None)
+                finally:
+                    connection.invalidate()  # 连接处于LISTEN状态, 不放回连接池
+            except Exception:
+                time.sleep(RECONNECT_INTERVAL)
+
+
+task_notifier = TaskNotifier()
+waiter_slots = threading.BoundedSemaphore(MAX_WAITERS)
+
+
+def commit_task_change(task):
+    """提交对任务的修改并通知订阅者"""
+    from app_wrapper import db
+
+    task_notifier.publish(db.session, task.id)
+    db.session.commit()
+    task_notifier.notify_local(task.id)
+
+
+def enqueue_task(task):
+    """
+    插入新任务; 能被领取的任务(cado-nfs任务, p为空)会唤醒等待中的实验室计算机
+    分布式rho任务不进入领取队列(见task_queue), 计算机通过/crypto/dlp/rho/...参与, 插入时不发通知
+    """
+    from app_wrapper import db
+    from app.main.dlp.stats import record_task_added
+
+    claimable = task.p is None
+    db.session.add(task)
+    db.session.flush()
+    record_task_added(task)
+    if claimable:
+        task_notifier.publish(db.session, task.id)
+    db.session.commit()
+    if claimable:
+        task_notifier.notify_local(task.id)
+    return task
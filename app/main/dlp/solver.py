@@ -0,0 +1,329 @@
+"""
+本地DLP求解: 求x使得 g^x = y (mod p), p为素数
+适用于cado-nfs之外的"简单"实例, 在时间预算内求解, 超时则抛出DLPTimeout, 交由实验室计算机处理:
+- 群阶p-1光滑: 分解p-1, 求出g的阶, 对每个素数幂分量用Pohlig-Hellman化归到素数阶子群,
+  素数阶子群中较小的用小步大步(BSGS), 较大的用带可区分点的Pollard rho, 最后用CRT合并
+- 指数范围已知较小(x < bound): 直接在整个群上做BSGS
+
+所有循环都会定期检查截止时间, 因此在进程池中运行时不会长期占用工作进程
+"""
+import math
+import os
+import random
+import time
+
+from app.main.arith import invert, is_prime, powmod
+from app.main.pool import get_process_pool
+
+# 本地求解的默认时间预算(秒)
+TIME_BUDGET = float(os.environ.get("DLP_LOCAL_TIME_BUDGET", "10"))
+# 素数阶不超过该值时用BSGS, 否则用Pollard rho
+BSGS_MAX_ORDER = 1 << 36
+# 指数范围不超过该值时才对整个群做BSGS, 小步表最多约2^20项
+BSGS_MAX_BOUND = 1 << 40
+# 试除的上限
+TRIAL_DIVISION_BOUND = 1 << 16
+# 每隔多少次迭代检查一次截止时间
+CHECK_INTERVAL = 4096
+# r-adding walk的分支数
+WALK_BRANCHES = 32
+
+
+class DLPTimeout(Exception):
+    pass
+
+
+def _check_deadline(deadline):
+    if deadline is not None and time.monotonic() > deadline:
+        raise DLPTimeout("超出时间预算")
+
+
+def _pollard_brent(n: int, deadline) -> int:
+    """返回n的一个非平凡因子, n为奇合数"""
+    while True:
+        y, c, m = random.randrange(1, n), random.randrange(1, n), 128
+        d, r, q = 1, 1, 1
+        x = ys = y
+        while d == 1:
+            x = y
+            for _ in range(r):
+                y = (y * y + c) % n
+            k = 0
+            while k < r and d == 1:
+                ys = y
+                for _ in range(min(m, r - k)):
+                    y = (y * y + c) % n
+                    q = q * abs(x - y) % n
+                d = math.gcd(q, n)
+                k += m
+                _check_deadline(deadline)
+            r <<= 1
+        if d == n:
+            d = 1
+            while d == 1:
+                ys = (ys * ys + c) % n
+                d = math.gcd(abs(x - ys), n)
+        if d != n:
+            return d
+
+
+def factorize(n: int, deadline=None) -> dict:
+    """分解n, 返回{素因子: 指数}"""
+    factors = {}
+    for f in (2, 3, 5):
+        while n % f == 0:
+            factors[f] = factors.get(f, 0) + 1
+            n //= f
+    f, step = 7, 4
+    while f < TRIAL_DIVISION_BOUND and f * f <= n:
+        while n % f == 0:
+            factors[f] = factors.get(f, 0) + 1
+            n //= f
+        f += step
+        step = 6 - step
+    stack = [n] if n > 1 else []
+    while stack:
+        m = stack.pop()
+        if is_prime(m):
+            factors[m] = factors.get(m, 0) + 1
+            continue
+        root = math.isqrt(m)
+        if root * root == m:
+            stack += [root, root]
+            continue
+        d = _pollard_brent(m, deadline)
+        stack += [d, m // d]
+    return factors
+
+
+def element_order(g: int, p: int, factors: dict) -> (int, dict):
+    """根据p-1的分解求g的阶, 返回(阶, 阶的分解)"""
+    order = p - 1
+    order_factors = dict(factors)
+    for q, e in factors.items():
+        for _ in range(e):
+            if powmod(g, order // q, p) != 1:
+                break
+            order //= q
+            order_factors[q] -= 1
+    return order, {q: e for q, e in order_factors.items() if e}
+
+
+def bsgs(g: int, y: int, p: int, bound: int, deadline=None):
+    """在[0, bound)中求x使得g^x = y (mod p), 无解时返回None"""
+    m = math.isqrt(max(bound - 1, 0)) + 1
+    table = {}
+    value = 1
+    for j in range(m):
+        table.setdefault(value, j)
+        value = value * g % p
+        if j % CHECK_INTERVAL == 0:
+            _check_deadline(deadline)
+    factor = invert(powmod(g, m, p), p)
+    gamma = y % p
+    for i in range(m):
+        j = table.get(gamma)
+        if j is not None and i * m + j < bound:
+            return i * m + j
+        gamma = gamma * factor % p
+        if i % CHECK_INTERVAL == 0:
+            _check_deadline(deadline)
+    return None
+
+
+class RhoWalk:
+    """
+    素数阶q子群上的r-adding walk: 状态(x, a, b)满足x = g^a * y^b
+    下一步由x的哈希选择乘子 M_j = g^(c_j) * y^(d_j); 乘子由walk_seed确定, 因此可以在不同进程/计算机上复现同一个游走
+    低dp_bits位全为0的x是可区分点, 两个系数不同的可区分点相同即可求出对数
+    """
+
+    def __init__(self, p: int, g: int, y: int, q: int, walk_seed: int = 0, dp_bits: int = None):
+        self.p, self.g, self.y, self.q = p, g, y, q
+        self.walk_seed = walk_seed
+        # 期望步数约sqrt(q), 让每次游走平均产生约2^10个可区分点
+        self.dp_bits = dp_bits if dp_bits is not None else max(0, q.bit_length() // 2 - 10)
+        self.dp_mask = (1 << self.dp_bits) - 1
+        rng = random.Random(walk_seed)
+        self.coefficients = [(rng.randrange(q), rng.randrange(q)) for _ in range(WALK_BRANCHES)]
+        self.multipliers = [powmod(g, c, p) * powmod(y, d, p) % p for c, d in self.coefficients]
+
+    def to_definition(self) -> dict:
+        """游走函数的完整定义, 其他计算机据此即可复现游走, 无需依赖本模块的随机数实现"""
+        return dict(p=str(self.p), g=str(self.g), y=str(self.y), q=str(self.q),
+                    dp_bits=self.dp_bits,
+                    branches=WALK_BRANCHES,
+                    multipliers=[str(m) for m in self.multipliers],
+                    coefficients=[[str(c), str(d)] for c, d in self.coefficients])
+
+    @classmethod
+    def from_definition(cls, definition: dict):
+        walk = cls.__new__(cls)
+        walk.p, walk.g, walk.y, walk.q = (int(definition[name]) for name in ("p", "g", "y", "q"))
+        walk.walk_seed = None
+        walk.dp_bits = int(definition["dp_bits"])
+        walk.dp_mask = (1 << walk.dp_bits) - 1
+        walk.multipliers = [int(m) for m in definition["multipliers"]]
+        walk.coefficients = [(int(c), int(d)) for c, d in definition["coefficients"]]
+        return walk
+
+    def is_valid_point(self, x: int, a: int, b: int) -> bool:
+        """检查提交的点确实是可区分点且满足x = g^a * y^b"""
+        return (x & self.dp_mask == 0 and 0 <= a < self.q and 0 <= b < self.q
+                and powmod(self.g, a, self.p) * powmod(self.y, b, self.p) % self.p == x)
+
+    def start(self, rng) -> (int, int, int):
+        a, b = rng.randrange(self.q), rng.randrange(self.q)
+        return powmod(self.g, a, self.p) * powmod(self.y, b, self.p) % self.p, a, b
+
+    def run(self, x: int, a: int, b: int, max_steps: int) -> (int, int, int, bool):
+        """
+        从(x, a, b)出发游走, 遇到可区分点或走满max_steps步时停止
+        返回(x, a, b, 是否为可区分点)
+        """
+        p, q, mask = self.p, self.q, self.dp_mask
+        multipliers, coefficients = self.multipliers, self.coefficients
+        for _ in range(max_steps):
+            j = x % WALK_BRANCHES
+            x = x * multipliers[j] % p
+            c, d = coefficients[j]
+            a, b = a + c, b + d
+            if x & mask == 0:
+                return x, a % q, b % q, True
+        return x, a % q, b % q, False
+
+    def solve_collision(self, a1: int, b1: int, a2: int, b2: int):
+        """由g^a1 * y^b1 = g^a2 * y^b2求log_g(y), b1 = b2时返回None"""
+        if (b1 - b2) % self.q == 0:
+            return None
+        x = (a2 - a1) * invert(b1 - b2, self.q) % self.q
+        return x if powmod(self.g, x, self.p) == self.y % self.p else None
+
+
+def rho(g: int, y: int, p: int, q: int, deadline=None, walk_seed: int = 0):
+    """在素数阶q的子群中求log_g(y), g的阶为q且y在该子群中"""
+    if y % p == 1:
+        return 0
+    walk = RhoWalk(p, g, y, q, walk_seed)
+    rng = random.Random(walk_seed ^ 0x5eed)
+    points = {}  # 可区分点 -> (a, b)
+    # 游走可能陷入不含可区分点的环, 步数超过期望值的若干倍时重新开始
+    max_walk = 20 << walk.dp_bits
+    x, a, b = walk.start(rng)
+    walked = 0
+    while True:
+        x, a, b, distinguished = walk.run(x, a, b, CHECK_INTERVAL)
+        walked += CHECK_INTERVAL
+        _check_deadline(deadline)
+        if distinguished:
+            if x in points:
+                result = walk.solve_collision(*points[x], a, b)
+                if result is not None:
+                    return result
+            points[x] = (a, b)
+        if distinguished or walked > max_walk:
+            x, a, b = walk.start(rng)
+            walked = 0
+
+
+def _prime_order_log(g: int, y: int, p: int, q: int, deadline):
+    if q <= BSGS_MAX_ORDER:
+        return bsgs(g, y, p, q, deadline)
+    return rho(g, y, p, q, deadline)
+
+
+def pohlig_hellman(g: int, y: int, p: int, order: int, order_factors: dict, deadline=None):
+    """g的阶为order, 求log_g(y) mod order, y不在<g>中时返回None"""
+    if powmod(y, order, p) != 1:
+        return None
+    residues, moduli = [], []
+    for q, e in order_factors.items():
+        # 化归到阶为q^e的子群, 再逐位求q进制的各位
+        n = q ** e
+        g_n, y_n = powmod(g, order // n, p), powmod(y, order // n, p)
+        gamma = powmod(g_n, q ** (e - 1), p)  # 阶为q
+        x = 0
+        for k in range(e):
+            h = powmod(invert(powmod(g_n, x, p), p) * y_n % p, q ** (e - 1 - k), p)
+            d = _prime_order_log(gamma, h, p, q, deadline)
+            if d is None:
+                return None
+            x += d * q ** k
+        residues.append(x)
+        moduli.append(n)
+    return crt(residues, moduli)
+
+
+def crt(residues: list, moduli: list) -> int:
+    """两两互素的模数下的中国剩余定理"""
+    x, m = 0, 1
+    for r, n in zip(residues, moduli):
+        x += m * ((r - x) * invert(m, n) % n)
+        m *= n
+    return x % m
+
+
+def solve(p: int, g: int, y: int, bound: int = None, time_budget: float = TIME_BUDGET):
+    """
+    求最小的非负x使得g^x = y (mod p); 无解时返回None, 超出时间预算时抛出DLPTimeout
+    bound: 已知x < bound时可指定
+    """
+    deadline = time.monotonic() + time_budget
+    g, y = g % p, y % p
+    if not g or not y:
+        return None
+    if bound is not None and bound <= BSGS_MAX_BOUND:
+        return bsgs(g, y, p, bound, deadline)
+
+    factors = factorize(p - 1, deadline)
+    order, order_factors = element_order(g, p, factors)
+    x = pohlig_hellman(g, y, p, order, order_factors, deadline)
+    if x is None or (bound is not None and x >= bound):
+        return None
+    return x
+
+
+def solve_in_pool(p: int, g: int, y: int, bound: int = None, time_budget: float = TIME_BUDGET):
+    """在进程池中求解, 避免占用处理请求的线程; 返回值与solve相同"""
+    return get_process_pool().submit(solve, p, g, y, bound, time_budget).result()
+
+
+def test():
+    # 光滑阶
+    p = 2 * 3 ** 5 * 5 ** 3 * 7 * 11 * 13 * 1000003 * 4294967497 + 1
+    assert is_prime(p)
+    for g, x in ((3, 123456789), (5, 0), (7, p - 2), (2, 2 ** 60 + 12345)):
+        y = powmod(g, x, p)
+        result = solve(p, g, y)
+        assert powmod(g, result, p) == y
+    assert solve(p, 1, 2) is None
+
+    # 需要Pollard rho的素数阶分量
+    q = 1099511627791  # 2^40 + 15, 素数
+    assert is_prime(q)
+    k = 2
+    while not is_prime(k * q + 1):
+        k += 2
+    p = k * q + 1
+    g = next(h for h in range(2, 100) if element_order(h, p, factorize(p - 1))[0] == p - 1)
+    y = powmod(g, 987654321987, p)
+    assert powmod(g, solve(p, g, y, time_budget=60), p) == y
+
+    # 指数范围较小
+    p = 2 ** 127 - 1
+    y = powmod(3, 123456789, p)
+    assert solve(p, 3, y, bound=1 << 30) == 123456789
+    assert solve(p, 3, y, bound=1 << 20) is None
+    p = 2 ** 255 - 19  # p-1含有很大的素因子
+    try:
+        solve(p, 2, powmod(2, 2 ** 200 + 1, p), time_budget=0.5)
+        assert False
+    except DLPTimeout:
+        pass
+
+    assert crt([2, 3, 2], [3, 5, 7]) == 23
+    assert factorize(2 ** 64 + 1) == {274177: 1, 67280421310721: 1}
+
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,60 @@
+"""
+DLP任务计数
+/crypto/dlp/current_task_status需要的总数、未完成数和队头任务保存在TaskStats的唯一一行中,
+发布和完成任务时在同一事务内用原子的UPDATE增减, 读取时只需按主键取一行
+该行不存在时(刚升级或被误删)从Task表重新统计一次
+"""
+from sqlalchemy import func, select, update
+
+from app_wrapper import db
+from database.models import Task, TaskStats
+
+STATS_ID = 1
+
+
+def _first_unfinished_id():
+    # 由部分索引ix_task_unfinished_id支持
+    return db.session.execute(select(func.min(Task.id)).where(Task.finished == False)).scalar()
+
+
+def rebuild_stats() -> TaskStats:
+    stats = db.session.get(TaskStats, STATS_ID) or TaskStats(id=STATS_ID)
+    stats.task_count = Task.query.count()
+    stats.not_finished_count = Task.query.filter(Task.finished == False).count()
+    stats.head_task_id = _first_unfinished_id()
+    db.session.add(stats)
+    db.session.flush()
+    return stats
+
+
+def get_stats() -> TaskStats:
+    stats = db.session.get(TaskStats, STATS_ID)
+    if stats is None:
+        stats = rebuild_stats()
+        db.session.commit()
+    return stats
+
+
+def _apply(**values):
+    result = db.session.execute(update(TaskStats).where(TaskStats.id == STATS_ID).values(**values)
+                                .execution_options(synchronize_session=False))
+    if result.rowcount == 0:
+        rebuild_stats()  # 重新统计的结果已经包含了本次修改
+
+
+def record_task_added(task):
+    """在提交插入task的事务之前调用, task需已flush"""
+    db.session.flush()
+    if task.finished:
+        _apply(task_count=TaskStats.task_count + 1)
+    else:
+        _apply(task_count=TaskStats.task_count + 1,
+               not_finished_count=TaskStats.not_finished_count + 1,
+               head_task_id=func.coalesce(TaskStats.head_task_id, task.id))
+
+
+def record_task_finished(task):
+    """在提交把task标记为完成的事务之前调用"""
+    db.session.flush()
+    _apply(not_finished_count=TaskStats.not_finished_count - 1,
+           head_task_id=select(func.min(Task.id)).where(Task.finished == False).scalar_subquery())
@@ -0,0 +1,93 @@
+"""
+DLP任务队列
+实验室计算机通过领取(claim)获得任务, 领取时写入claimed_by和租约到期时间lease_expires_at;
+计算过程中定期发送心跳续约, 租约到期仍未完成的任务会被其他计算机重新领取
+
+PostgreSQL上使用 SELECT ... FOR UPDATE SKIP LOCKED, 并发领取的计算机各自跳过被锁住的行;
+其他数据库(如测试用的SQLite)不支持行锁, 改为带条件的UPDATE(比较并交换), 失败时重试
+"""
+import datetime
+import os
+
+from sqlalchemy import and_, or_, update
+
+from app_wrapper import db
+from database.models import Task
+
+# 租约时长(秒)
+LEASE_SECONDS = int(os.environ.get("DLP_LEASE_SECONDS", "600"))
+# 比较并交换失败时的最大重试次数
+CLAIM_RETRIES = 8
+
+
+def _now() -> datetime.datetime:
+    return datetime.datetime.utcnow()
+
+
+def _claimable(now: datetime.datetime):
+    # 带有p, y的任务由分布式rho求解, 不交给cado-nfs
+    return and_(Task.finished == False,
+                Task.p == None,
+                or_(Task.lease_expires_at == None, Task.lease_expires_at < now))
+
+
+def claim_task(worker: str, lease_seconds: int = LEASE_SECONDS):
+    """
+    原子地领取编号最小的可领取任务, 没有可领取的任务时返回None
+    """
+    if db.engine.dialect.name == "postgresql":
+        return _claim_with_row_lock(worker, lease_seconds)
+    return _claim_with_compare_and_swap(worker, lease_seconds)
+
+
+def _claim_with_row_lock(worker: str, lease_seconds: int):
+    now = _now()
+    task = Task.query.filter(_claimable(now)).order_by(Task.id).with_for_update(skip_locked=True).first()
+    if task is None:
+        db.session.rollback()
+        return None
+    task.claimed_by = worker
+    task.lease_expires_at = now + datetime.timedelta(seconds=lease_seconds)
+    db.session.commit()
+    return task
+
+
+def _claim_with_compare_and_swap(worker: str, lease_seconds: int):
+    for _ in range(CLAIM_RETRIES):
+        now = _now()
+        task = Task.query.filter(_claimable(now)).order_by(Task.id).first()
+        if task is None:
+            return None
+        # 只有在其他计算机抢先领取之前, 这条UPDATE才会命中
+        result = db.session.execute(
+            update(Task)
+            .where(and_(Task.id == task.id, _claimable(now)))
+            .values(claimed_by=worker, lease_expires_at=now + datetime.timedelta(seconds=lease_seconds))
+            .execution_options(synchronize_session=False))
+        db.session.commit()
+        if result.rowcount == 1:
+            db.session.refresh(task)
+            return task
+    return None
+
+
+def next_lease_expiry():
+    """尚未完成的任务中最早到期的租约, 没有时返回None; 等待新任务的计算机最迟在此时重新尝试领取"""
+    task = (Task.query.filter(Task.finished == False, Task.p == None, Task.lease_expires_at != None)
+            .order_by(Task.lease_expires_at).first())
+    return task.lease_expires_at if task else None
+
+
+def renew_lease(task_id: int, worker: str, lease_seconds: int = LEASE_SECONDS):
+    """
+    心跳续约, 只有当前持有该任务的计算机才能续约
+    返回新的到期时间, 续约失败(任务已完成或已被其他计算机领取)时返回None
+    """
+    lease_expires_at = _now() + datetime.timedelta(seconds=lease_seconds)
+    result = db.session.execute(
+        update(Task)
+        .where(and_(Task.id == task_id, Task.finished == False, Task.claimed_by == worker))
+        .values(lease_expires_at=lease_expires_at)
+        .execution_options(synchronize_session=False))
+    db.session.commit()
+    return lease_expires_at if result.rowcount == 1 else None
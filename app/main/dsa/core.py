@@ -8,6 +8,11 @@ from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.asymmetric import dsa
 from cryptography.hazmat.primitives.asymmetric.utils import decode_dss_signature, encode_dss_signature
 
+from app.main.arith import invert
+from app.main.dsa.fixed_base import MAX_TABLE_EXP_BITS, FixedBaseTable, fixed_base_cache, fixed_base_pow
+from app.main.dsa.multi_exp import dual_pow
+from app.main.dsa.nonce_pool import MAX_NONCE_ATTEMPTS, generate_nonce, nonce_pool
+
 
 def generate_params(key_size=2048) -> (int, int, int):
     """
@@ -20,37 +25,47 @@ def generate_params(key_size=2048) -> (int, int, int):
 
 def generate_key_pair(p, q, g) -> (int, int):
     private_key = secrets.randbelow(q - 1) + 1
-    public_key = pow(g, private_key, p)
+    public_key = fixed_base_pow(p, g, private_key, q.bit_length())
     return private_key, public_key
 
 
+def msg_digest(msg: bytes) -> bytes:
+    """消息摘要, 签名和验证使用的都是SHA-256"""
+    return hashlib.sha256(msg).digest()
+
+
 def sign(p: int, q: int, g: int, x: int, msg: bytes, k: Union[int, None] = None) -> (int, int):
     """
     签名
     x: 私钥
     """
-    if k is None:
-        while True:
-            k = secrets.randbelow(q - 1) + 1
+    return sign_digest(p, q, g, x, msg_digest(msg), k)
 
-            r = pow(g, k, p) % q
-            if r == 0:
-                continue
 
-            msg_digest_bytes = hashlib.sha256(msg).digest()
-            msg_digest_int = int.from_bytes(msg_digest_bytes, "big")
-            s = (pow(k, -1, q) * (msg_digest_int + x * r % q) % q) % q
+def sign_digest(p: int, q: int, g: int, x: int, digest: bytes, k: Union[int, None] = None) -> (int, int):
+    """
+    对已经算好的消息摘要签名, 供流式计算摘要的大文件使用
+    x: 私钥
+    digest: SHA-256摘要
+    """
+    msg_digest_int = int.from_bytes(digest, "big")
+    if k is None:
+        for _ in range(MAX_NONCE_ATTEMPTS):
+            # 优先使用预计算的(k, r, k^-1), 池为空时现场计算
+            nonce = nonce_pool.take(p, q, g)
+            _, r, k_inv = nonce if nonce is not None else generate_nonce(p, q, g)
+
+            s = (k_inv * (msg_digest_int + x * r % q) % q) % q
             if s == 0:
                 continue
             return r, s
+        raise ValueError("s总是为0, 请检查参数")
     else:  # 给定了随机数k, 用于给同学们校验自己的
-        r = pow(g, k, p) % q
+        r = fixed_base_pow(p, g, k, q.bit_length()) % q
         if r == 0:
             raise ValueError("r = 0")
 
-        msg_digest_bytes = hashlib.sha256(msg).digest()
-        msg_digest_int = int.from_bytes(msg_digest_bytes, "big")
-        s = (pow(k, -1, q) * (msg_digest_int + x * r % q) % q) % q
+        s = (invert(k, q) * (msg_digest_int + x * r % q) % q) % q
         if s == 0:
             raise ValueError("s = 0")
         return r, s
@@ -61,25 +76,62 @@ def verify(p: int, q: int, g: int, y: int, msg: bytes, sig: (int, int)) -> bool:
     验证签名
     y: 公钥
     """
+    return verify_digest(p, q, g, y, msg_digest(msg), sig)
+
+
+def verify_digest(p: int, q: int, g: int, y: int, digest: bytes, sig: (int, int), y_table=None) -> bool:
+    """
+    根据已经算好的消息摘要验证签名
+    y: 公钥
+    digest: SHA-256摘要
+    y_table: 公钥y的固定底数预计算表(可选)
+    """
     r, s = sig
     if not (0 < r < q and 0 < s < q):
         return False
-    w = pow(s, -1, q)
+    w = invert(s, q)
 
-    msg_digest_bytes = hashlib.sha256(msg).digest()
-    msg_digest_int = int.from_bytes(msg_digest_bytes, "big")
+    msg_digest_int = int.from_bytes(digest, "big")
 
     u1 = msg_digest_int * w % q
     u2 = r * w % q
-    v = (pow(g, u1, p) * pow(y, u2, p) % p) % q
+    v = dual_pow(p, g, u1, y, u2, q.bit_length(), y_table) % q
     return v == r
 
 
+# 批量验证中同一公钥出现的次数达到该值时, 为其单独建预计算表
+PUBLIC_KEY_TABLE_THRESHOLD = 16
+
+
+def verify_batch(p: int, q: int, g: int, items: list) -> list:
+    """
+    在同一组(p, q, g)下批量验证签名
+    items: [(y, msg, (r, s)), ...]
+    返回: 与items顺序一致的验证结果列表
+
+    标准DSA的r是(g^k mod p) mod q, 丢失了g^k mod p本身, 无法用随机小指数把多条验证等式合并成一次,
+    因此逐条精确验证, 只在条目之间共享预计算: g的固定底数表只建一次, 重复出现的公钥y也单独建表
+    """
+    exp_bits = q.bit_length()
+    # g的表在整批中都会用到, 第一次遇到也立即建表, 之后每条验证都能从缓存中取到
+    fixed_base_cache.get(p, g, exp_bits, force=len(items) > 1)
+
+    y_counts = {}
+    for y, _, _ in items:
+        y_counts[y] = y_counts.get(y, 0) + 1
+    y_tables = {y: FixedBaseTable(p, y, exp_bits) for y, count in y_counts.items()
+                if count >= PUBLIC_KEY_TABLE_THRESHOLD and exp_bits <= MAX_TABLE_EXP_BITS}
+
+    return [verify_digest(p, q, g, y, msg_digest(msg), sig, y_tables.get(y)) for y, msg, sig in items]
+
+
 def test():
     p, q, g = generate_params()
     x, y = generate_key_pair(p, q, g)
     sig = sign(p, q, g, x, b'China')
     assert verify(p, q, g, y, b'China', sig)
+    assert verify_digest(p, q, g, y, hashlib.sha256(b'China').digest(), sig)
+    assert sign_digest(p, q, g, x, msg_digest(b'China'), 12345) == sign(p, q, g, x, b'China', 12345)
     print()
     print("p:{}\nq:{}\ng:{}\nx:{}\ny:{}\n".format(p, q, g, x, y))
 
@@ -144,7 +196,25 @@ def test_union2():
     assert verify(p, q, g, y, b'China', decode_dss_signature(x_sig))
 
 
+def test_batch():
+    p, q, g = generate_params()
+    keys = [generate_key_pair(p, q, g) for _ in range(3)]
+    items = []
+    for i in range(40):
+        x, y = keys[i % 2] if i < 36 else keys[2]  # 前两个公钥各出现18次, 会单独建表
+        msg = "msg{}".format(i).encode()
+        sig = sign(p, q, g, x, msg)
+        if i % 7 == 3:
+            sig = (sig[0], sig[1] ^ 1)  # 篡改
+        items.append((y, msg, sig))
+    items.append((keys[0][1], b"bad", (0, 1)))
+    expected = [verify(p, q, g, y, msg, sig) for y, msg, sig in items]
+    assert verify_batch(p, q, g, items) == expected
+    assert expected.count(False) == 7
+
+
 if __name__ == '__main__':
     test()
+    test_batch()
     test_union()
     test_union2()
@@ -1,13 +1,15 @@
 import hashlib
+import json
 from typing import Union
 
-from flask import request, jsonify
+from flask import request, jsonify, Response, stream_with_context
 from flask_cors import cross_origin
 
 from app.main import main
-from app.main.dsa.core import generate_params, sign, verify
-from app.main.dsa.hack_dsa import hack_core
-from app.main.tools import hex2, hex_to_bytes
+from app.main.dsa.core import sign, verify, verify_batch, sign_digest, verify_digest, msg_digest
+from app.main.dsa.hack_dsa import SameKScanner, hack_core
+from app.main.dsa.params_pool import params_pool, KEY_SIZES
+from app.main.tools import hex2, hex_to_bytes, MAX_BATCH_SIZE
 
 
 class IntConverter:
@@ -84,6 +86,15 @@ def convert_all_data_dict_to_int(post_json: dict, *data_names) -> list:
     return result
 
 
+def convert_all_args_to_int(args, *data_names) -> list:
+    """
+    从查询参数或表单中读取整数参数, 格式为 name=value, 类型由可选的 name_type 指定(默认为dec)
+    """
+    post_json = {name: {"type": args.get(name + "_type", "dec"), "value": args.get(name)}
+                 for name in data_names if name in args}
+    return convert_all_data_dict_to_int(post_json, *data_names)
+
+
 def convert_all_data_dict_to_bytes(post_json: dict, *data_names) -> list:
     result = []
     for name in data_names:
@@ -104,8 +115,20 @@ def convert_all_data_dict_to_bytes(post_json: dict, *data_names) -> list:
 @main.route('/crypto/dsa/params', methods=["POST"])
 @cross_origin()
 def generate_dsa_params():
+    """
+    获取DSA域参数, 优先从预生成的参数池中取出
+    参数：json(可选)
+    - key_size: p的比特长度, 可选1024/2048/3072, 默认为2048
+    """
+    post_data = request.get_json(silent=True) or {}
+    try:
+        key_size = int(post_data.get("key_size", 2048))
+    except (TypeError, ValueError):
+        key_size = None
+    if key_size not in KEY_SIZES:
+        return jsonify(success=False, reason="key_size只能是{}".format("/".join(map(str, KEY_SIZES))))
     try:
-        p, q, g = generate_params()
+        p, q, g = params_pool.take(key_size)
         p_hex = hex2(p)
         q_hex = hex2(q)
         g_hex = hex2(g)
@@ -147,7 +170,10 @@ def dsa_sign():
         except Exception as e:
             return jsonify(success=False, reason=str(e))
 
-    r_dec, s_dec = sign(p, q, alpha, a, msg_bytes, k)
+    try:
+        r_dec, s_dec = sign(p, q, alpha, a, msg_bytes, k)
+    except ValueError as e:
+        return jsonify(success=False, reason=str(e))
     r_hex = hex2(r_dec)
     s_hex = hex2(s_dec)
     return jsonify(success=True, gamma=str(r_dec), delta=str(s_dec), gamma_hex=r_hex, delta_hex=s_hex)
@@ -179,6 +205,119 @@ def dsa_verify():
     return jsonify(success=True, verify_result=result)
 
 
+# 流式计算摘要时每次读取的字节数
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def stream_msg_digest():
+    """
+    以固定大小的块读取消息并增量计算SHA-256摘要, 内存占用与消息大小无关
+    - Content-Type为application/octet-stream时, 请求体即为消息, 其余参数放在查询参数中
+    - Content-Type为multipart/form-data时, 消息为文件字段msg, 其余参数放在表单或查询参数中
+    返回: (摘要, 其余参数)
+    """
+    if request.mimetype == "multipart/form-data":
+        msg_file = request.files.get("msg")
+        if msg_file is None:
+            raise ValueError("文件msg为空, 请检查")
+        stream, args = msg_file.stream, request.values
+    elif request.mimetype == "application/octet-stream":
+        stream, args = request.stream, request.args
+    else:
+        raise ValueError("Content-Type只能是application/octet-stream或multipart/form-data")
+
+    hash_obj = hashlib.sha256()
+    while True:
+        chunk = stream.read(STREAM_CHUNK_SIZE)
+        if not chunk:
+            break
+        hash_obj.update(chunk)
+    return hash_obj.digest(), args
+
+
+@main.route('/crypto/dsa/sign_stream', methods=["POST"])
+@cross_origin()
+def dsa_sign_stream():
+    """
+    对大文件签名, 消息以流的方式上传
+    参数: 见stream_msg_digest, 需要p, q, alpha, a, 可选k; 每个参数可用 name_type 指定类型(dec/hex)
+    """
+    try:
+        digest, args = stream_msg_digest()
+        p, q, alpha, a = convert_all_args_to_int(args, "p", "q", "alpha", "a")
+        k, = convert_all_args_to_int(args, "k") if "k" in args else (None,)
+    except Exception as e:
+        return jsonify(success=False, reason=str(e))
+
+    try:
+        r_dec, s_dec = sign_digest(p, q, alpha, a, digest, k)
+    except ValueError as e:
+        return jsonify(success=False, reason=str(e))
+    return jsonify(success=True, gamma=str(r_dec), delta=str(s_dec), gamma_hex=hex2(r_dec), delta_hex=hex2(s_dec))
+
+
+@main.route('/crypto/dsa/verify_stream', methods=["POST"])
+@cross_origin()
+def dsa_verify_stream():
+    """
+    验证大文件的签名, 消息以流的方式上传
+    参数: 见stream_msg_digest, 需要p, q, alpha, beta, gamma, delta; 每个参数可用 name_type 指定类型(dec/hex)
+    """
+    try:
+        digest, args = stream_msg_digest()
+        p, q, alpha, beta, r, s = convert_all_args_to_int(args, "p", "q", "alpha", "beta", "gamma", "delta")
+    except Exception as e:
+        return jsonify(success=False, reason=str(e))
+
+    result = verify_digest(p, q, alpha, beta, digest, (r, s))
+    return jsonify(success=True, verify_result=result)
+
+
+@main.route('/crypto/dsa/verify_batch', methods=["POST"])
+@cross_origin()
+def dsa_verify_batch():
+    """
+    在同一组(p, q, alpha)下批量验证签名
+    参数：json
+    - p, q, alpha: 与/crypto/dsa/verify相同
+    - items: 列表, 每项包含beta, msg, gamma, delta, 格式与/crypto/dsa/verify相同
+    返回：json
+    - success: 是否成功
+    - results: 与items顺序一致的列表, 每项包含
+        - success: 该项参数是否合法
+        - verify_result: 验证结果
+        - reason: 如果success=False, 失败的理由
+    """
+    post_data = request.get_json()
+    try:
+        p, q, alpha = convert_all_data_dict_to_int(post_data, "p", "q", "alpha")
+    except Exception as e:
+        return jsonify(success=False, reason=str(e))
+
+    items = post_data.get("items")
+    if not isinstance(items, list):
+        return jsonify(success=False, reason="参数items为空, 请检查")
+    if len(items) > MAX_BATCH_SIZE:
+        return jsonify(success=False, reason="单次最多验证{}个签名".format(MAX_BATCH_SIZE))
+
+    results = [None] * len(items)
+    pending_indices, pending_items = [], []
+    for i, item in enumerate(items):
+        try:
+            beta, r, s = convert_all_data_dict_to_int(item, "beta", "gamma", "delta")
+            msg_bytes, = convert_all_data_dict_to_bytes(item, "msg")
+        except Exception as e:
+            results[i] = dict(success=False, reason=str(e))
+            continue
+        pending_indices.append(i)
+        pending_items.append((beta, msg_bytes, (r, s)))
+
+    for i, result in zip(pending_indices, verify_batch(p, q, alpha, pending_items)):
+        results[i] = dict(success=True, verify_result=result)
+
+    return jsonify(success=True, results=results)
+
+
 @main.route('/crypto/dsa/hack_same_k', methods=['POST'])
 @cross_origin()
 def hack_same_k():
@@ -204,3 +343,50 @@ def hack_same_k():
 
     except Exception as e:
         return jsonify(success=False, reason=str(e))
+
+
+@main.route('/crypto/dsa/hack_same_k_bulk', methods=['POST'])
+@cross_origin()
+def hack_same_k_bulk():
+    """
+    批量查找并破解重复使用k的签名
+    参数：请求体为JSONL, 每行一条签名记录, 包含q, msg, gamma, delta, 格式与/crypto/dsa/hack_same_k相同
+    返回：JSONL, 边扫描边输出
+    - 找到碰撞时: {"success": true, "line1", "line2", "k", "private_key", ...}, line为记录在请求体中的行号(从1开始)
+    - 某行格式有误时: {"success": false, "line", "reason"}
+    - 最后一行: {"done": true, "records": 有效记录数, "collisions": 破解成功的次数}
+    """
+    def dump(obj):
+        return json.dumps(obj, ensure_ascii=False) + "\n"
+
+    def generate():
+        scanner = SameKScanner()
+        records = collisions = 0
+        for line_no, line in enumerate(request.stream, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                q, gamma, delta = convert_all_data_dict_to_int(record, "q", "gamma", "delta")
+                msg_bytes, = convert_all_data_dict_to_bytes(record, "msg")
+            except Exception as e:
+                yield dump(dict(success=False, line=line_no, reason=str(e)))
+                continue
+            records += 1
+            found = scanner.add(line_no, q, int.from_bytes(msg_digest(msg_bytes), "big"), gamma, delta)
+            if found is None:
+                continue
+            first_line, _, q, gamma, k, private_key = found
+            collisions += 1
+            yield dump(dict(success=True,
+                            line1=first_line,
+                            line2=line_no,
+                            q=str(q),
+                            gamma=str(gamma),
+                            k=str(k),
+                            private_key=str(private_key),
+                            k_hex=hex2(k),
+                            private_key_hex=hex2(private_key)))
+        yield dump(dict(done=True, records=records, collisions=collisions))
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
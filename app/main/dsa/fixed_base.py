@@ -0,0 +1,174 @@
+"""
+固定底数模幂
+同一组(p, g)下会反复计算g^k mod p(签名、生成密钥对), 为其预先计算窗口表:
+table[i][j] = g^(j * 2^(w*i)) mod p, 之后每次模幂只需约 exp_bits / w 次模乘, 无需平方
+预计算表按(p, g)缓存在有界LRU中, 第二次遇到同一组(p, g)时才建表, 避免一次性的参数白白付出建表开销
+表的大小与指数的比特数成正比, 指数超过MAX_TABLE_EXP_BITS时不建表, 直接使用普通模幂
+"""
+import threading
+from collections import OrderedDict
+
+from app.main.arith import powmod, to_native
+
+WINDOW_BITS = 6
+CACHE_SIZE = 16  # 最多缓存的(p, g)组数, 2048比特的p、256比特的指数下每张表约700KB
+# 建表的指数比特数上限, q由用户提交, 不加限制时与p等长的q可使每张表达到数MB
+MAX_TABLE_EXP_BITS = 512
+
+
+class FixedBaseTable:
+    def __init__(self, p: int, g: int, exp_bits: int, window_bits: int = WINDOW_BITS):
+        self.p = p
+        self.g = g
+        self.exp_bits = exp_bits
+        self.window_bits = window_bits
+        self._mask = (1 << window_bits) - 1
+
+        modulus = to_native(p)
+        base = to_native(g) % modulus
+        one = to_native(1)
+        rows = []
+        for _ in range(-(-exp_bits // window_bits)):
+            row = [one]
+            for _ in range(self._mask):
+                row.append(row[-1] * base % modulus)
+            rows.append(row)
+            base = row[-1] * base % modulus  # base^(2^w)
+        self._rows = rows
+        self._modulus = modulus
+
+    def pow(self, e: int) -> int:
+        """计算g^e mod p, 指数超出建表范围时退化为普通模幂"""
+        if e < 0 or e.bit_length() > self.exp_bits:
+            return powmod(self.g, e, self.p)
+
+        result = None
+        mask, window_bits, modulus = self._mask, self.window_bits, self._modulus
+        for row in self._rows:
+            if not e:
+                break
+            digit = e & mask
+            if digit:
+                result = row[digit] if result is None else result * row[digit] % modulus
+            e >>= window_bits
+        return 1 % self.p if result is None else int(result)
+
+
+class FixedBaseCache:
+    """
+    以(p, g)为键的预计算表LRU
+    on_evict中的回调会在某组(p, g)被淘汰时调用, 便于依附于该组参数的其他缓存一并清理
+    """
+
+    def __init__(self, max_size: int = CACHE_SIZE):
+        self.max_size = max_size
+        self.on_evict = []
+        self._lock = threading.Lock()
+        self._tables = OrderedDict()  # (p, g) -> FixedBaseTable或None(只见过一次, 尚未建表)
+
+    def get(self, p: int, g: int, exp_bits: int, force: bool = False):
+        """
+        返回(p, g)的预计算表; 第一次遇到时只做记录并返回None
+        force: 第一次遇到时也立即建表(调用方确定会多次使用时)
+        exp_bits超过MAX_TABLE_EXP_BITS时总是返回None
+        """
+        if exp_bits > MAX_TABLE_EXP_BITS:
+            return None
+        key = (p, g)
+        with self._lock:
+            if key in self._tables:
+                self._tables.move_to_end(key)
+                table = self._tables[key]
+                if table is not None and table.exp_bits >= exp_bits:
+                    return table
+                need_build = True
+            else:
+                self._tables[key] = None
+                need_build = force
+            evicted = self._evict()
+        self._notify(evicted)
+        if not need_build:
+            return None
+
+        table = FixedBaseTable(p, g, exp_bits)
+        with self._lock:
+            if key in self._tables:
+                self._tables[key] = table
+        return table
+
+    def __contains__(self, key):
+        with self._lock:
+            return self._tables.get(key) is not None
+
+    def _evict(self) -> list:
+        evicted = []
+        while len(self._tables) > self.max_size:
+            key, _ = self._tables.popitem(last=False)
+            evicted.append(key)
+        return evicted
+
+    def _notify(self, evicted: list):
+        for p, g in evicted:
+            for callback in self.on_evict:
+                callback(p, g)
+
+
+fixed_base_cache = FixedBaseCache()
+
+
+def fixed_base_pow(p: int, g: int, e: int, exp_bits: int) -> int:
+    """
+    计算g^e mod p, (p, g)重复出现时使用预计算表
+    exp_bits: 该组参数下指数的最大比特数, 一般为q的比特长度
+    """
+    table = fixed_base_cache.get(p, g, exp_bits)
+    if table is None:
+        return powmod(g, e, p)
+    return table.pow(e)
+
+
+def test():
+    import secrets
+
+    p = 2 ** 127 - 1
+    g = 3
+    for window_bits in (1, 4, 6):
+        table = FixedBaseTable(p, g, 128, window_bits)
+        for e in (0, 1, 2, 63, 64, 2 ** 127 - 2, secrets.randbits(128)):
+            assert table.pow(e) == pow(g, e, p)
+    assert FixedBaseTable(p, g, 64).pow(2 ** 100) == pow(g, 2 ** 100, p)  # 超出建表范围
+
+    cache = FixedBaseCache(max_size=2)
+    evicted = []
+    cache.on_evict.append(lambda _p, _g: evicted.append(_g))
+    assert fixed_base_pow(p, 5, 12345, 128) == pow(5, 12345, p)
+    assert cache.get(p, 5, 128) is None and cache.get(p, 5, 128) is not None
+    cache.get(p, 6, 128)
+    cache.get(p, 7, 128)
+    assert evicted == [5] and (p, 5) not in cache
+    assert cache.get(p, 8, MAX_TABLE_EXP_BITS + 1, force=True) is None and (p, 8) not in cache
+
+
+def benchmark(number=200):
+    import secrets
+    import timeit
+
+    from app.main.dsa.core import generate_params
+
+    p, q, g = generate_params(2048)
+    exponents = [secrets.randbelow(q) for _ in range(number)]
+
+    build = timeit.timeit(lambda: FixedBaseTable(p, g, q.bit_length()), number=1)
+    table = FixedBaseTable(p, g, q.bit_length())
+    plain = timeit.timeit(lambda: [powmod(g, k, p) for k in exponents], number=1)
+    fixed = timeit.timeit(lambda: [table.pow(k) for k in exponents], number=1)
+    print("g^k mod p, 2048-bit p, {}-bit k, {} runs".format(q.bit_length(), number))
+    print("build table:  {:.3f}ms".format(build * 1e3))
+    print("powmod:       {:.3f}ms".format(plain / number * 1e3))
+    print("fixed base:   {:.3f}ms".format(fixed / number * 1e3))
+    print("speedup:      {:.2f}x".format(plain / fixed))
+
+
+if __name__ == '__main__':
+    test()
+    benchmark()
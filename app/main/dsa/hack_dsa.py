@@ -1,17 +1,59 @@
 import hashlib
 
+from app.main.arith import invert
 from app.main.dsa.core import generate_params, generate_key_pair, sign
 
 
 def hack_core(delta1: int, gamma1: int, msg_digest1: int, delta2: int, gamma2: int, msg_digest2: int, q: int):
     try:
-        k = (((msg_digest1 - msg_digest2) % q) * (pow(delta1 - delta2, -1, q) % q)) % q
-        priv = (((((delta1 * k) % q) - msg_digest1) % q) * pow(gamma1, -1, q)) % q
+        k = (((msg_digest1 - msg_digest2) % q) * (invert(delta1 - delta2, q) % q)) % q
+        priv = (((((delta1 * k) % q) - msg_digest1) % q) * invert(gamma1, q)) % q
         return k, priv
     except Exception as e:
         return None
 
 
+class SameKScanner:
+    """
+    以(q, gamma)为键建立哈希表, 逐条加入签名即可找出所有碰撞; 表中只保留每个键第一次出现的记录, 不保留消息本身
+    """
+
+    def __init__(self):
+        self._first_seen = {}  # (q, gamma) -> (序号, msg_digest, delta)
+
+    def add(self, index: int, q: int, msg_digest: int, gamma: int, delta: int):
+        """
+        加入第index条签名, msg_digest为消息摘要的整数形式
+        与之前的某条签名使用了同一个k且能够破解时返回(第一条记录的序号, index, q, gamma, k, 私钥), 否则返回None
+        """
+        key = (q, gamma)
+        if key not in self._first_seen:
+            self._first_seen[key] = (index, msg_digest, delta)
+            return None
+
+        first_index, first_digest, first_delta = self._first_seen[key]
+        if (msg_digest - first_digest) % q == 0:  # 同一消息(重复提交或摘要相同), 无法求解
+            return None
+        result = hack_core(first_delta, gamma, first_digest, delta, gamma, msg_digest, q)
+        if result is None:
+            return None
+        k, priv = result
+        return first_index, index, q, gamma, k, priv
+
+
+def scan_same_k(records):
+    """
+    在大量签名中查找重复使用k的签名对并破解, 一次线性扫描
+    records: 可迭代对象, 每项为(q, msg_digest, gamma, delta), msg_digest为消息摘要的整数形式
+    逐个产生(第一条记录的序号, 碰撞记录的序号, q, gamma, k, 私钥)
+    """
+    scanner = SameKScanner()
+    for index, (q, msg_digest, gamma, delta) in enumerate(records):
+        found = scanner.add(index, q, msg_digest, gamma, delta)
+        if found is not None:
+            yield found
+
+
 def main():
     p, q, g = generate_params()
     private_key, public_key = generate_key_pair(p, q, g)
@@ -26,5 +68,22 @@ def main():
     print("private_key(true): ", private_key)
 
 
+def test_scan():
+    p, q, g = generate_params(1024)
+    keys = [generate_key_pair(p, q, g) for _ in range(3)]
+    records = []
+    for i in range(30):
+        private_key, _ = keys[i % 3]
+        msg = "msg{}".format(i).encode()
+        k = 1000 + i % 3 if i in (1, 4, 10) else None  # 第1, 4, 10条由同一私钥用同一个k签名
+        gamma, delta = sign(p, q, g, private_key, msg, k)
+        records.append((q, int.from_bytes(hashlib.sha256(msg).digest(), "big"), gamma, delta))
+    records.append(records[1])  # 重复提交
+    found = list(scan_same_k(records))
+    assert [(first, second) for first, second, *_ in found] == [(1, 4), (1, 10)]
+    assert all(k == 1001 and priv == keys[1][0] for *_, k, priv in found)
+
+
 if __name__ == '__main__':
     main()
+    test_scan()
@@ -0,0 +1,87 @@
+"""
+双底数模幂 g^u1 * y^u2 mod p (DSA验证)
+(p, g)已有固定底数预计算表时, g^u1查表, 只剩y^u2一次模幂;
+否则使用Shamir/Straus技巧, 两个指数按窗口交替扫描, 共用同一串平方
+"""
+from app.main.arith import powmod, to_native
+from app.main.dsa.fixed_base import fixed_base_cache
+
+WINDOW_BITS = 2  # 联合窗口宽度, 预计算 2^w * 2^w 个 g^i * y^j
+
+
+def shamir_pow(p: int, g: int, u1: int, y: int, u2: int, window_bits: int = WINDOW_BITS) -> int:
+    """单次交替扫描计算g^u1 * y^u2 mod p, 要求u1, u2非负"""
+    size = 1 << window_bits
+    modulus = to_native(p)
+    one = to_native(1) % modulus
+
+    g_powers, y_powers = [one], [one]
+    g_native, y_native = to_native(g) % modulus, to_native(y) % modulus
+    for _ in range(size - 1):
+        g_powers.append(g_powers[-1] * g_native % modulus)
+        y_powers.append(y_powers[-1] * y_native % modulus)
+    table = [[a * b % modulus for b in y_powers] for a in g_powers]
+
+    mask = size - 1
+    window_count = -(-max(u1.bit_length(), u2.bit_length()) // window_bits)
+    result = one
+    for i in range(window_count - 1, -1, -1):
+        for _ in range(window_bits):
+            result = result * result % modulus
+        shift = i * window_bits
+        d1, d2 = (u1 >> shift) & mask, (u2 >> shift) & mask
+        if d1 or d2:
+            result = result * table[d1][d2] % modulus
+    return int(result)
+
+
+def dual_pow(p: int, g: int, u1: int, y: int, u2: int, exp_bits: int, y_table=None) -> int:
+    """
+    计算g^u1 * y^u2 mod p
+    exp_bits: 指数的最大比特数, 一般为q的比特长度
+    y_table: y的固定底数预计算表(可选), 批量验证中重复出现的公钥使用
+    """
+    table = fixed_base_cache.get(p, g, exp_bits)
+    if table is None and y_table is None:
+        return shamir_pow(p, g, u1, y, u2)
+    g_u1 = table.pow(u1) if table is not None else powmod(g, u1, p)
+    y_u2 = y_table.pow(u2) if y_table is not None else powmod(y, u2, p)
+    return g_u1 * y_u2 % p
+
+
+def test():
+    import secrets
+
+    p = 2 ** 127 - 1
+    for u1, u2 in ((0, 0), (1, 0), (0, 1), (5, 7), (secrets.randbits(127), secrets.randbits(64))):
+        expected = pow(3, u1, p) * pow(11, u2, p) % p
+        for window_bits in (1, 2, 3):
+            assert shamir_pow(p, 3, u1, 11, u2, window_bits) == expected
+        for _ in range(3):  # 第二次起使用预计算表
+            assert dual_pow(p, 3, u1, 11, u2, 127) == expected
+
+
+def benchmark(number=50):
+    import secrets
+    import timeit
+
+    from app.main.dsa.core import generate_params
+    from app.main.dsa.fixed_base import FixedBaseTable
+
+    p, q, g = generate_params(2048)
+    y = powmod(g, secrets.randbelow(q), p)
+    pairs = [(secrets.randbelow(q), secrets.randbelow(q)) for _ in range(number)]
+    table = FixedBaseTable(p, g, q.bit_length())
+
+    plain = timeit.timeit(lambda: [powmod(g, u1, p) * powmod(y, u2, p) % p for u1, u2 in pairs], number=1)
+    shamir = timeit.timeit(lambda: [shamir_pow(p, g, u1, y, u2) for u1, u2 in pairs], number=1)
+    cached = timeit.timeit(lambda: [table.pow(u1) * powmod(y, u2, p) % p for u1, u2 in pairs], number=1)
+    print("g^u1 * y^u2 mod p, 2048-bit p, {}-bit u, {} runs".format(q.bit_length(), number))
+    print("two powmods:      {:.3f}ms".format(plain / number * 1e3))
+    print("shamir:           {:.3f}ms".format(shamir / number * 1e3))
+    print("table + powmod:   {:.3f}ms".format(cached / number * 1e3))
+
+
+if __name__ == '__main__':
+    test()
+    benchmark()
@@ -0,0 +1,167 @@
+"""
+DSA签名随机数预计算池
+签名中的 r = (g^k mod p) mod q 和 k^-1 mod q 都与消息无关, 可以在空闲时预先算好,
+签名请求到来时只需计算 s = k^-1 * (H(m) + x * r) mod q
+
+池按(p, q, g)分组, 每组第一次签名时登记, 之后由后台线程在没有签名请求时补充; 三元组取出即从池中删除, 绝不重复使用
+固定底数预计算表淘汰某组(p, g)时, 对应的池一并丢弃; 登记的组数也有上限, 超出时丢弃最久未用的一组
+参数由学生提交, 无法生成随机数的组(q不是素数、r总是为0等)在补充失败后直接丢弃
+"""
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict, deque
+
+from app.main.arith import invert
+from app.main.dsa.fixed_base import fixed_base_cache, fixed_base_pow
+
+# 每组参数保留的三元组个数
+POOL_SIZE = int(os.environ.get("DSA_NONCE_POOL_SIZE", "64"))
+# 最多登记的参数组数
+MAX_KEYS = 16
+# 距最近一次取用超过该时间(秒)才认为空闲, 开始补充, 避免与请求线程争抢GIL
+IDLE_SECONDS = 0.2
+# 重新选取k的次数上限, q正确时r = 0的概率可以忽略, 超过上限说明参数有误
+MAX_NONCE_ATTEMPTS = 64
+
+
+def generate_nonce(p: int, q: int, g: int) -> (int, int, int):
+    """生成一个(k, r, k^-1 mod q), 保证r != 0; 参数有误时抛出ValueError"""
+    if q < 2:
+        raise ValueError("q必须大于1")
+    for _ in range(MAX_NONCE_ATTEMPTS):
+        k = secrets.randbelow(q - 1) + 1
+        r = fixed_base_pow(p, g, k, q.bit_length()) % q
+        if r != 0:
+            return k, r, invert(k, q)
+    raise ValueError("r总是为0, 请检查参数")
+
+
+class NoncePool:
+    def __init__(self, size: int):
+        self.size = size
+        self._lock = threading.Lock()
+        self._nonces = OrderedDict()  # (p, q, g) -> deque of (k, r, k^-1), 按最近使用排序
+        self._wakeup = threading.Event()
+        self._last_take = 0.0
+        self._pid = None
+
+    def take(self, p: int, q: int, g: int):
+        """
+        取出一个预计算的(k, r, k^-1), 池为空(或该组参数第一次出现)时返回None, 由调用方现场计算
+        """
+        self._ensure_started()
+        key = (p, q, g)
+        with self._lock:
+            self._last_take = time.monotonic()
+            nonces = self._nonces.get(key)
+            if nonces is None:
+                self._nonces[key] = deque()
+                while len(self._nonces) > MAX_KEYS:
+                    self._nonces.popitem(last=False)
+                nonce = None
+            else:
+                self._nonces.move_to_end(key)
+                nonce = nonces.popleft() if nonces else None
+        if self.size > 0:
+            self._wakeup.set()
+        return nonce
+
+    def drop(self, p: int, g: int):
+        """丢弃(p, g)下的所有三元组"""
+        with self._lock:
+            for key in [key for key in self._nonces if key[0] == p and key[2] == g]:
+                del self._nonces[key]
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(nonces) for nonces in self._nonces.values())
+
+    def _ensure_started(self):
+        # gunicorn的worker是fork出来的, 父进程中预计算的随机数不能在多个worker中重复使用
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            self._pid = pid
+            self._nonces.clear()
+            threading.Thread(target=self._refill_loop, name="dsa-nonce-refill", daemon=True).start()
+
+    def _next_key(self):
+        """返回最缺三元组的一组参数, 都已补满时返回None"""
+        with self._lock:
+            lacking = [(len(nonces), key) for key, nonces in self._nonces.items() if len(nonces) < self.size]
+        return min(lacking)[1] if lacking else None
+
+    def _refill_loop(self):
+        while True:
+            self._wakeup.clear()
+            key = self._next_key()
+            if key is None:
+                self._wakeup.wait()
+                continue
+            busy = self._last_take + IDLE_SECONDS - time.monotonic()
+            if busy > 0:  # 仍有签名请求到来, 等空闲后再补充
+                time.sleep(busy)
+                continue
+            try:
+                nonce = generate_nonce(*key)
+            except Exception:  # 参数有误, 丢弃这一组, 补充线程继续为其他组工作
+                with self._lock:
+                    self._nonces.pop(key, None)
+                continue
+            with self._lock:
+                nonces = self._nonces.get(key)
+                if nonces is not None:  # 生成期间该组参数可能已被淘汰
+                    nonces.append(nonce)
+
+
+nonce_pool = NoncePool(POOL_SIZE)
+fixed_base_cache.on_evict.append(nonce_pool.drop)
+
+
+def test():
+    import time
+
+    from app.main.dsa.core import generate_params
+
+    p, q, g = generate_params(1024)
+    pool = NoncePool(8)
+    assert pool.take(p, q, g) is None  # 第一次出现只登记
+    deadline = time.time() + 10
+    while len(pool) < 8 and time.time() < deadline:
+        time.sleep(0.01)
+    assert len(pool) == 8
+
+    seen = set()
+    for _ in range(8):
+        k, r, k_inv = pool.take(p, q, g)
+        assert r == pow(g, k, p) % q and k * k_inv % q == 1
+        assert k not in seen
+        seen.add(k)
+
+    pool.drop(p, g)
+    assert len(pool) == 0 and pool.take(p, q, g) is None
+
+    # 有误的参数不影响补充线程
+    assert pool.take(23, 15, 2) is None  # q不是素数, 部分k不可逆
+    for bad_key in ((23, 1, 2), (23, 11, 0)):
+        assert pool.take(*bad_key) is None
+        try:
+            generate_nonce(*bad_key)
+            assert False
+        except ValueError:
+            pass
+    pool.drop(p, g)
+    pool.take(p, q, g)
+    deadline = time.time() + 10
+    while len(pool) < 8 and time.time() < deadline:
+        time.sleep(0.01)
+    assert len(pool) == 8 and all(key not in pool._nonces for key in ((23, 1, 2), (23, 11, 0)))
+
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,131 @@
+"""
+DSA域参数池
+预先生成若干组(p, q, g), 请求时直接取出, 池为空时才在请求中现场生成
+
+池保存在磁盘上的目录中, 每组参数一个文件, 所有gunicorn worker共享:
+- 取出: 读取一个文件后删除它, 只有删除成功的worker才使用这组参数, 因此同一组参数不会被发出两次
+- 补充: 只有持有目录锁(flock)的一个worker运行补充线程, 实际的生成在进程池中完成;
+  每生成一组就写入一个新文件, 重启后无需从零开始; 持有者退出后锁自动释放, 由下一个取参数的worker接手
+"""
+import fcntl
+import json
+import os
+import threading
+import time
+
+from app.main.dsa.core import generate_params
+from app.main.pool import get_process_pool
+
+KEY_SIZES = (1024, 2048, 3072)
+
+
+def _parse_pool_sizes(value: str) -> dict:
+    """解析形如 1024:4,2048:16,3072:4 的配置"""
+    sizes = {}
+    for item in value.split(","):
+        key_size, size = item.split(":")
+        sizes[int(key_size)] = int(size)
+    return sizes
+
+
+# 每种密钥长度保留的参数组数
+POOL_SIZES = _parse_pool_sizes(os.environ.get("DSA_PARAMS_POOL_SIZES", "1024:4,2048:16,3072:4"))
+# 参数池的目录
+POOL_PATH = os.environ.get("DSA_PARAMS_POOL_PATH", "dsa_params_pool")
+# 补充线程检查池中剩余数量的间隔(秒), 其他worker取出参数时不会唤醒本进程的补充线程
+REFILL_INTERVAL = 5
+
+
+class DSAParamsPool:
+    def __init__(self, path: str, sizes: dict):
+        self.path = path
+        self.sizes = sizes
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._owner_pid = None
+        self._lock_file = None
+
+    def take(self, key_size: int = 2048) -> (int, int, int):
+        """
+        取出一组参数, 池为空时现场生成
+        """
+        self._ensure_owner()
+        self._wakeup.set()
+        for name in self._files(key_size):
+            file_path = os.path.join(self.path, name)
+            try:
+                with open(file_path) as f:
+                    p, q, g = json.load(f)
+                os.unlink(file_path)  # 其他worker已经取走时抛出FileNotFoundError
+            except FileNotFoundError:
+                continue
+            except (OSError, ValueError):  # 损坏的文件直接丢弃
+                self._discard(file_path)
+                continue
+            return int(p, 16), int(q, 16), int(g, 16)
+        return generate_params(key_size)
+
+    def __len__(self):
+        return sum(len(self._files(key_size)) for key_size in self.sizes)
+
+    def _files(self, key_size: int) -> list:
+        prefix = "{}-".format(key_size)
+        try:
+            names = os.listdir(self.path)
+        except OSError:
+            return []
+        return sorted(name for name in names if name.startswith(prefix) and name.endswith(".json"))
+
+    def _ensure_owner(self):
+        """尝试成为补充线程的唯一持有者, 同一时刻整个机器上只有一个进程能拿到目录锁"""
+        pid = os.getpid()
+        if self._owner_pid == pid:
+            return
+        with self._lock:
+            if self._owner_pid == pid:
+                return
+            try:
+                os.makedirs(self.path, exist_ok=True)
+                lock_file = open(os.path.join(self.path, ".lock"), "w")
+            except OSError:
+                return
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:  # 其他worker正在补充
+                lock_file.close()
+                return
+            self._lock_file = lock_file  # 保持打开, 进程退出时锁自动释放
+            self._owner_pid = pid
+            threading.Thread(target=self._refill_loop, name="dsa-params-refill", daemon=True).start()
+
+    def _refill_loop(self):
+        while True:
+            self._wakeup.clear()
+            for key_size, size in self.sizes.items():
+                while len(self._files(key_size)) < size:
+                    try:
+                        params = get_process_pool().submit(generate_params, key_size).result()
+                    except Exception:  # 进程池不可用等情况, 等待下次检查
+                        break
+                    self._store(key_size, params)
+            self._wakeup.wait(REFILL_INTERVAL)
+
+    def _store(self, key_size: int, params: (int, int, int)):
+        name = "{}-{}-{}.json".format(key_size, time.time_ns(), os.getpid())
+        tmp_path = os.path.join(self.path, name + ".tmp")
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump([hex(value) for value in params], f)
+            os.replace(tmp_path, os.path.join(self.path, name))  # 原子替换, 避免被读到写了一半的文件
+        except OSError:
+            self._discard(tmp_path)
+
+    @staticmethod
+    def _discard(file_path: str):
+        try:
+            os.unlink(file_path)
+        except OSError:
+            pass
+
+
+params_pool = DSAParamsPool(POOL_PATH, POOL_SIZES)
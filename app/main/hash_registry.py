@@ -0,0 +1,65 @@
+"""
+哈希函数注册表
+在导入时解析好所有可用的哈希函数, 请求处理时直接查表, 无需再构造哈希对象获取参数
+"""
+import functools
+import hashlib
+from collections import namedtuple
+from typing import Union
+
+OAEP_K = 256  # RSAES-OAEP编码后的长度(字节)
+
+HashInfo = namedtuple("HashInfo", ["name", "constructor", "digest_size", "max_message_length"])
+
+
+def _build_registry() -> dict:
+    registry = {}
+    for name in hashlib.algorithms_available:
+        name = name.lower()
+        # 优先使用hashlib.sha256这类直接构造函数, 否则通过hashlib.new构造
+        constructor = getattr(hashlib, name, None) or functools.partial(hashlib.new, name)
+        try:
+            digest_size = constructor().digest_size
+        except ValueError:  # OpenSSL中列出但不可用的算法
+            continue
+        if digest_size == 0:  # shake等可变长度输出的算法
+            continue
+        registry[name] = HashInfo(name=name,
+                                  constructor=constructor,
+                                  digest_size=digest_size,
+                                  max_message_length=OAEP_K - 2 * digest_size - 2)
+    return registry
+
+
+_REGISTRY = _build_registry()
+
+
+def resolve_hash(name: str) -> Union[HashInfo, None]:
+    """
+    根据名称(不区分大小写)查找哈希函数
+    找不到或名称不是字符串(例如json中的数字)时返回None
+    """
+    if not isinstance(name, str):
+        return None
+    return _REGISTRY.get(name.lower())
+
+
+@functools.lru_cache(maxsize=64)
+def digest_size_of(hash_func) -> int:
+    return hash_func().digest_size
+
+
+# 只缓存不超过该长度(字节)的label, 批量接口的label来自请求体, 长度不受限制, 不能长期留在缓存中
+MAX_CACHED_LABEL_LENGTH = 256
+
+
+@functools.lru_cache(maxsize=1024)
+def _cached_label_hash(hash_func, label: bytes) -> bytes:
+    return hash_func(label).digest()
+
+
+def label_hash(hash_func, label: bytes) -> bytes:
+    """OAEP中的lHash, 较短的label以(哈希函数, label)为键缓存"""
+    if len(label) > MAX_CACHED_LABEL_LENGTH:
+        return hash_func(label).digest()
+    return _cached_label_hash(hash_func, label)
@@ -1,15 +1,69 @@
 import hashlib
+import struct
+
+_COUNTER = struct.Struct(">I")
+# 预先打包常用的计数器, OAEP中的掩码最多只用到十几个块
+_PACKED_COUNTERS = tuple(_COUNTER.pack(i) for i in range(64))
+
 
 def i2osp(integer: int, size: int = 4) -> bytes:
-    return b"".join([chr((integer >> (8 * i)) & 0xFF).encode() for i in reversed(range(size))])
+    return integer.to_bytes(size, "big")
 
 
 def mgf1(input_str: bytes, length: int, hash_func=hashlib.sha256) -> bytes:
-    """Mask generation function."""
+    """
+    Mask generation function.
+    种子只哈希一次, 每个计数器块复制该哈希状态后再追加计数器
+    """
+    seed_hash = hash_func(input_str)
+    h_len = seed_hash.digest_size
+    block_count = -(-length // h_len)
+
+    output = bytearray(block_count * h_len)
+    for counter in range(block_count):
+        block_hash = seed_hash.copy()
+        if counter < len(_PACKED_COUNTERS):
+            block_hash.update(_PACKED_COUNTERS[counter])
+        else:
+            block_hash.update(_COUNTER.pack(counter))
+        output[counter * h_len:(counter + 1) * h_len] = block_hash.digest()
+    del output[length:]
+    return bytes(output)
+
+
+def _mgf1_reference(input_str: bytes, length: int, hash_func=hashlib.sha256) -> bytes:
+    """原先按定义逐块拼接的MGF1实现, 仅用于测试与基准对比(计数器小于128时结果正确)"""
     counter = 0
     output = b""
     while len(output) < length:
-        C = i2osp(counter, 4)
+        C = b"".join([chr((counter >> (8 * i)) & 0xFF).encode() for i in reversed(range(4))])
         output += hash_func(input_str + C).digest()
         counter += 1
-    return output[:length]
\ No newline at end of file
+    return output[:length]
+
+
+def test():
+    assert i2osp(0) == b"\x00\x00\x00\x00"
+    assert i2osp(0x01020304) == b"\x01\x02\x03\x04"
+    assert i2osp(200) == b"\x00\x00\x00\xc8"
+    for length in (0, 1, 32, 33, 128, 223, 1000):
+        for hash_func in (hashlib.sha1, hashlib.sha256, hashlib.sha512):
+            assert mgf1(b"seed", length, hash_func) == _mgf1_reference(b"seed", length, hash_func)
+
+
+def benchmark(number=20000):
+    import os
+    import timeit
+
+    seed = os.urandom(32)
+    reference = timeit.timeit(lambda: _mgf1_reference(seed, 223), number=number)
+    current = timeit.timeit(lambda: mgf1(seed, 223), number=number)
+    print("mgf1 dbMask (223 bytes, sha256), {} runs".format(number))
+    print("reference: {:.3f}us".format(reference / number * 1e6))
+    print("mgf1:      {:.3f}us".format(current / number * 1e6))
+    print("speedup:   {:.2f}x".format(reference / current))
+
+
+if __name__ == '__main__':
+    test()
+    benchmark()
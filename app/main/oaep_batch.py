@@ -0,0 +1,155 @@
+"""
+批量OAEP编码/解码
+多条消息以二维uint8数组的形式一起处理, 掩码的异或运算向量化完成, 结果存放在同一块连续内存中
+"""
+import hashlib
+import os
+from typing import List, Sequence, Union
+
+import numpy as np
+
+from .hash_registry import digest_size_of, label_hash
+from .mgf import mgf1
+from .rsa_simple_oaep import g
+
+K = 256  # 编码后的长度(字节), 与rsa_es_oaep保持一致
+SIMPLE_HALF = 128  # 简化版OAEP中m, r的长度(字节)
+
+
+def _mask_rows(rows: np.ndarray, mask_func, width: int) -> np.ndarray:
+    """对每一行分别计算长度为width的掩码, 拼接为与rows行数相同的二维数组"""
+    masks = b"".join([mask_func(row.tobytes()) for row in rows])
+    return np.frombuffer(masks, dtype=np.uint8).reshape(len(rows), width)
+
+
+def _as_rows(data, width: int, name: str) -> np.ndarray:
+    rows = np.ascontiguousarray(data, dtype=np.uint8)
+    if rows.ndim != 2 or rows.shape[1] != width:
+        raise ValueError("{} must be a 2-D uint8 array with {} columns".format(name, width))
+    return rows
+
+
+def simple_oaep_encode_batch(messages, rs) -> np.ndarray:
+    """
+    简化版OAEP批量编码, 与rsa_simple_oaep.oaep_encode逐行等价
+    messages: (N, 128) uint8, 已填充至128字节的消息
+    rs: (N, 128) uint8, 随机数
+    返回: (N, 256) uint8, 每行为 X || Y
+    """
+    messages = _as_rows(messages, SIMPLE_HALF, "messages")
+    rs = _as_rows(rs, SIMPLE_HALF, "rs")
+    if len(messages) != len(rs):
+        raise ValueError("messages and rs must have the same number of rows")
+
+    encoded = np.empty((len(messages), 2 * SIMPLE_HALF), dtype=np.uint8)
+    x, y = encoded[:, :SIMPLE_HALF], encoded[:, SIMPLE_HALF:]
+    np.bitwise_xor(messages, _mask_rows(rs, g, SIMPLE_HALF), out=x)
+    np.bitwise_xor(rs, _mask_rows(x, g, SIMPLE_HALF), out=y)
+    return encoded
+
+
+def simple_oaep_decode_batch(encoded) -> (np.ndarray, np.ndarray):
+    """
+    简化版OAEP批量解码
+    encoded: (N, 256) uint8
+    返回: (messages, rs), 均为(N, 128) uint8, 消息未去除前导0
+    """
+    encoded = _as_rows(encoded, 2 * SIMPLE_HALF, "encoded")
+    x, y = encoded[:, :SIMPLE_HALF], encoded[:, SIMPLE_HALF:]
+    rs = np.bitwise_xor(y, _mask_rows(x, g, SIMPLE_HALF))
+    messages = np.bitwise_xor(x, _mask_rows(rs, g, SIMPLE_HALF))
+    return messages, rs
+
+
+def eme_oaep_encode_batch(messages: Sequence[bytes], label: bytes = b"",
+                          hash_func=hashlib.sha256, mgf_hash_func=hashlib.sha256,
+                          seeds=None) -> np.ndarray:
+    """
+    EME-OAEP批量编码, 与rsa_es_oaep.oaep_encode逐条等价
+    messages: 消息列表, 长度可以不同
+    seeds: (可选) (N, hLen) uint8, 默认随机生成
+    返回: (N, 256) uint8, 每行为 0x00 || maskedSeed || maskedDB
+    """
+    h_len = digest_size_of(hash_func)
+    db_len = K - h_len - 1
+    count = len(messages)
+
+    # 构造 DB = lHash || PS || 0x01 || M
+    db = np.zeros((count, db_len), dtype=np.uint8)
+    db[:, :h_len] = np.frombuffer(label_hash(hash_func, label), dtype=np.uint8)
+    for i, message in enumerate(messages):
+        if len(message) > K - 2 * h_len - 2:
+            raise ValueError("message too long")
+        start = db_len - len(message)
+        db[i, start - 1] = 1
+        db[i, start:] = np.frombuffer(message, dtype=np.uint8)
+
+    if seeds is None:
+        seeds = np.frombuffer(os.urandom(count * h_len), dtype=np.uint8).reshape(count, h_len)
+    else:
+        seeds = _as_rows(seeds, h_len, "seeds")
+
+    encoded = np.zeros((count, K), dtype=np.uint8)
+    masked_seed, masked_db = encoded[:, 1:1 + h_len], encoded[:, 1 + h_len:]
+    np.bitwise_xor(db, _mask_rows(seeds, lambda s: mgf1(s, db_len, mgf_hash_func), db_len), out=masked_db)
+    np.bitwise_xor(seeds, _mask_rows(masked_db, lambda s: mgf1(s, h_len, mgf_hash_func), h_len), out=masked_seed)
+    return encoded
+
+
+def eme_oaep_decode_batch(encoded, label: bytes = b"",
+                          hash_func=hashlib.sha256, mgf_hash_func=hashlib.sha256) -> List[Union[bytes, None]]:
+    """
+    EME-OAEP批量解码, 与rsa_es_oaep.oaep_decode逐条等价
+    encoded: (N, 256) uint8
+    返回: 消息列表, 解码失败的项为None
+    """
+    encoded = _as_rows(encoded, K, "encoded")
+    h_len = digest_size_of(hash_func)
+    db_len = K - h_len - 1
+
+    masked_seed, masked_db = encoded[:, 1:1 + h_len], encoded[:, 1 + h_len:]
+    seeds = np.bitwise_xor(masked_seed, _mask_rows(masked_db, lambda s: mgf1(s, h_len, mgf_hash_func), h_len))
+    db = np.bitwise_xor(masked_db, _mask_rows(seeds, lambda s: mgf1(s, db_len, mgf_hash_func), db_len))
+
+    l_hash = np.frombuffer(label_hash(hash_func, label), dtype=np.uint8)
+    hash_matched = np.all(db[:, :h_len] == l_hash, axis=1)
+    rest = db[:, h_len:]
+    nonzero = rest != 0
+    has_separator = nonzero.any(axis=1)
+    separator = nonzero.argmax(axis=1)  # 第一个非0字节的位置
+
+    result = []
+    for i in range(len(db)):
+        if not hash_matched[i] or not has_separator[i] or rest[i, separator[i]] != 1:
+            result.append(None)
+        else:
+            result.append(rest[i, separator[i] + 1:].tobytes())
+    return result
+
+
+def test():
+    from .rsa_es_oaep import oaep_encode, oaep_decode
+    from .rsa_simple_oaep import oaep_encode as simple_oaep_encode, oaep_decode as simple_oaep_decode
+
+    count = 16
+    messages = np.frombuffer(os.urandom(count * SIMPLE_HALF), dtype=np.uint8).reshape(count, SIMPLE_HALF)
+    rs = np.frombuffer(os.urandom(count * SIMPLE_HALF), dtype=np.uint8).reshape(count, SIMPLE_HALF)
+    encoded = simple_oaep_encode_batch(messages, rs)
+    for i in range(count):
+        assert encoded[i].tobytes() == simple_oaep_encode(messages[i].tobytes(), rs[i].tobytes())
+    decoded_messages, decoded_rs = simple_oaep_decode_batch(encoded)
+    assert np.array_equal(decoded_messages, messages) and np.array_equal(decoded_rs, rs)
+    assert simple_oaep_decode(encoded[0].tobytes())[1] == rs[0].tobytes()
+
+    eme_messages = [b"", b"a", b"hello", os.urandom(189) + b"!"]
+    encoded = eme_oaep_encode_batch(eme_messages, b"label")
+    assert eme_oaep_decode_batch(encoded, b"label") == eme_messages
+    assert eme_oaep_decode_batch(encoded, b"other") == [None] * len(eme_messages)
+    for i, message in enumerate(eme_messages[1:], 1):
+        assert oaep_decode(encoded[i].tobytes(), b"label") == message
+    single = np.frombuffer(oaep_encode(b"hello"), dtype=np.uint8).reshape(1, K)
+    assert eme_oaep_decode_batch(single) == [b"hello"]
+
+
+if __name__ == '__main__':
+    test()
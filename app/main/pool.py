@@ -0,0 +1,29 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# 进程池大小, 默认为CPU核数
+POOL_WORKERS = int(os.environ.get("CRYPTO_POOL_WORKERS", "0")) or os.cpu_count() or 1
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """
+    获取当前进程的进程池(懒加载)
+    gunicorn的worker是fork出来的, 因此按pid区分, 不与父进程共享进程池
+    子进程由forkserver创建: 后台线程提交任务时直接fork多线程的worker进程,
+    可能继承其他线程持有的锁(例如OpenSSL内部的锁)而死锁
+    """
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is None or _pool_pid != pid:
+        with _pool_lock:
+            if _pool is None or _pool_pid != pid:
+                _pool = ProcessPoolExecutor(max_workers=POOL_WORKERS,
+                                            mp_context=multiprocessing.get_context("forkserver"))
+                _pool_pid = pid
+    return _pool
@@ -0,0 +1,131 @@
+"""
+按花名册预先计算的PRG答案索引
+种子(学号)事先已知, 可以离线算好每个种子在默认p, g下的512比特输出, 写成按种子排序的定长记录:
+    8字节大端序种子 + 64字节输出(高位在前)
+服务器启动时以mmap打开环境变量PRG_ANSWER_INDEX指定的文件, 校验时二分查找后直接比较字节, 不做模幂
+
+生成索引:
+    python -m app.main.prg.answer_index roster.txt -o prg_answers.idx
+roster.txt中每行一个十进制种子, 空行和#开头的行会被忽略
+"""
+import argparse
+import mmap
+import os
+
+import numpy as np
+
+from app.main.pool import POOL_WORKERS, get_process_pool
+from app.main.prg.batch import generate_bits_batch
+
+SEED_BYTES = 8
+OUTPUT_BITS = 512
+RECORD_SIZE = SEED_BYTES + OUTPUT_BITS // 8
+INDEX_PATH_ENV = "PRG_ANSWER_INDEX"
+
+
+class AnswerIndex:
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size % RECORD_SIZE:
+                raise ValueError("{}的大小不是{}字节的整数倍".format(path, RECORD_SIZE))
+            # 映射建立后即可关闭文件; 空文件无法映射
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self._count = size // RECORD_SIZE
+
+    def __len__(self):
+        return self._count
+
+    def lookup(self, seed: int):
+        """二分查找seed, 返回64字节的输出, 不在索引中时返回None"""
+        if not 0 <= seed < 1 << (SEED_BYTES * 8):
+            return None
+        key = seed.to_bytes(SEED_BYTES, "big")
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset = mid * RECORD_SIZE
+            current = self._data[offset:offset + SEED_BYTES]
+            if current < key:
+                lo = mid + 1
+            elif current > key:
+                hi = mid
+            else:
+                return self._data[offset + SEED_BYTES:offset + RECORD_SIZE]
+        return None
+
+
+def load_answer_index():
+    """加载PRG_ANSWER_INDEX指定的索引, 未配置时返回None"""
+    path = os.environ.get(INDEX_PATH_ENV)
+    if not path:
+        return None
+    return AnswerIndex(path)
+
+
+def _build_records(seeds: list) -> bytes:
+    outputs = np.packbits(generate_bits_batch(seeds, OUTPUT_BITS), axis=1)
+    return b"".join(seed.to_bytes(SEED_BYTES, "big") + output.tobytes() for seed, output in zip(seeds, outputs))
+
+
+def build_index(seeds, path: str, chunk_size: int = 1024):
+    """计算seeds的输出并写入索引文件, 各块在进程池中并行计算"""
+    seeds = sorted(set(seeds))
+    if seeds and not (0 <= seeds[0] and seeds[-1] < 1 << (SEED_BYTES * 8)):
+        raise ValueError("种子必须是小于2^{}的非负整数".format(SEED_BYTES * 8))
+    chunk_size = max(1, min(chunk_size, -(-len(seeds) // POOL_WORKERS)))
+    chunks = [seeds[i:i + chunk_size] for i in range(0, len(seeds), chunk_size)]
+
+    tmp_path = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp_path, "wb") as f:
+        for records in get_process_pool().map(_build_records, chunks):
+            f.write(records)
+    os.replace(tmp_path, path)  # 原子替换, 正在运行的服务器仍使用旧文件的映射
+    return len(seeds)
+
+
+def read_roster(path: str) -> list:
+    seeds = []
+    with open(path) as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if not line.isdigit():
+                raise ValueError("第{}行不是十进制整数: {}".format(line_no, line))
+            seeds.append(int(line))
+    return seeds
+
+
+def test():
+    import tempfile
+
+    from app.main.prg.core import tiny_random_generator
+
+    seeds = [20214876, 0, 5, 2 ** 64 - 1, 123456789, 5]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "answers.idx")
+        assert build_index(seeds, path, chunk_size=2) == 5
+        index = AnswerIndex(path)
+        assert len(index) == 5
+        for seed in seeds:
+            z_str = tiny_random_generator(seed)[0]
+            assert index.lookup(seed) == int(z_str, 2).to_bytes(64, "big")
+        for seed in (1, 6, 20214877, 2 ** 64, -1):
+            assert index.lookup(seed) is None
+
+        build_index([], path)
+        assert len(AnswerIndex(path)) == 0 and AnswerIndex(path).lookup(5) is None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="根据花名册生成PRG答案索引")
+    parser.add_argument("roster", help="花名册文件, 每行一个十进制种子")
+    parser.add_argument("-o", "--output", default="prg_answers.idx", help="索引文件路径")
+    args = parser.parse_args()
+    count = build_index(read_roster(args.roster), args.output)
+    print("wrote {} records to {}".format(count, args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+"""
+多种子并行的PRG引擎, 用于批量批改
+N个种子的状态存放在uint64数组中, 每一步对所有种子同时计算 s_i = g^s_{i-1} mod p:
+- g固定, 预先按窗口建表 table[w][d] = g^(d * 2^(window_bits * w)) mod p, 每步只需 (窗口数 - 1) 次模乘, 无需平方
+- 模乘使用R = 2^64的Montgomery乘法, 64x64位乘积用32位分块计算, 因此要求p为小于2^64的奇数(默认的p满足);
+  p > 2^63时约减结果可能超过2^64, 需要单独处理进位
+不满足条件的参数退化为逐个调用core中的标量实现
+"""
+from functools import lru_cache
+
+import numpy as np
+
+from app.main.arith import powmod
+from app.main.prg.core import DEFAULT_P, DEFAULT_G, first_mismatch
+
+WINDOW_BITS = 16  # 4个窗口, 表大小4 * 65536 * 8字节 = 2MB, 建表约0.15秒(按(p, g)缓存)
+_MASK32 = np.uint64(0xFFFFFFFF)
+_SHIFT32 = np.uint64(32)
+
+
+def supports(p: int) -> bool:
+    """p能否使用并行引擎"""
+    return p % 2 == 1 and 2 < p < 2 ** 64
+
+
+def _mul_wide(a: np.ndarray, b: np.ndarray) -> (np.ndarray, np.ndarray):
+    """逐元素计算a * b的完整128位乘积, 返回(高64位, 低64位)"""
+    a0, a1 = a & _MASK32, a >> _SHIFT32
+    b0, b1 = b & _MASK32, b >> _SHIFT32
+    p00, p01, p10, p11 = a0 * b0, a0 * b1, a1 * b0, a1 * b1
+    mid = (p00 >> _SHIFT32) + (p01 & _MASK32) + (p10 & _MASK32)
+    lo = (p00 & _MASK32) | (mid << _SHIFT32)
+    hi = p11 + (p01 >> _SHIFT32) + (p10 >> _SHIFT32) + (mid >> _SHIFT32)
+    return hi, lo
+
+
+def _mont_mul(a: np.ndarray, b: np.ndarray, p: np.uint64, p_neg_inv: np.uint64) -> np.ndarray:
+    """逐元素计算a * b * 2^-64 mod p, 要求a, b < p"""
+    t_hi, t_lo = _mul_wide(a, b)
+    m = t_lo * p_neg_inv  # 模2^64
+    mp_hi, _ = _mul_wide(m, np.broadcast_to(p, m.shape))
+    # t_lo + m * p的低64位必为0, 仅在t_lo != 0时向高位进1
+    carry = (t_lo != 0).astype(np.uint64)
+    s = t_hi + mp_hi
+    overflow = s < t_hi
+    s2 = s + carry
+    overflow |= s2 < s
+    # 真实结果 < 2p, 超过2^64或不小于p时减一次p即可
+    return np.where(overflow | (s2 >= p), s2 - p, s2)
+
+
+@lru_cache(maxsize=8)
+def _window_table(p: int, g: int, window_bits: int) -> np.ndarray:
+    """
+    table[w][d] = g^(d * 2^(window_bits * w)) mod p
+    除最后一个窗口外都存放Montgomery形式(乘以2^64), 这样连乘 (窗口数 - 1) 次后结果恰好是普通形式
+    """
+    windows = -(-64 // window_bits)
+    size = 1 << window_bits
+    r = 2 ** 64 % p
+    table = np.empty((windows, size), dtype=np.uint64)
+    base = g % p
+    for w in range(windows):
+        factor = 1 if w == windows - 1 else r
+        value = 1
+        row = []
+        for _ in range(size):
+            row.append(value * factor % p)
+            value = value * base % p
+        table[w] = row
+        base = value  # base^(2^window_bits)
+    return table
+
+
+class MultiSeedPRG:
+    def __init__(self, seeds, p=DEFAULT_P, g=DEFAULT_G, window_bits=WINDOW_BITS):
+        if not supports(p):
+            raise ValueError("并行引擎要求p为小于2^64的奇数")
+        self._table = _window_table(p, g, window_bits)
+        self._window_bits = np.uint64(window_bits)
+        self._digit_mask = np.uint64((1 << window_bits) - 1)
+        self._p = np.uint64(p)
+        self._p_neg_inv = np.uint64(-pow(p, -1, 2 ** 64) % 2 ** 64)
+        # 种子可以任意大, 第一步逐个计算, 之后的指数都小于p
+        self.states = np.array([powmod(g, seed, p) for seed in seeds], dtype=np.uint64)
+        self._first = True
+
+    def step(self) -> np.ndarray:
+        """所有种子前进一步, 返回本步输出的比特(uint8数组)"""
+        if self._first:
+            self._first = False
+        else:
+            exponents = self.states
+            acc = self._table[0][exponents & self._digit_mask]
+            for w in range(1, len(self._table)):
+                digits = (exponents >> (self._window_bits * np.uint64(w))) & self._digit_mask
+                acc = _mont_mul(acc, self._table[w][digits], self._p, self._p_neg_inv)
+            self.states = acc
+        return (self.states & np.uint64(1)).astype(np.uint8)
+
+    def select(self, keep: np.ndarray):
+        """只保留keep为True的种子"""
+        self.states = self.states[keep]
+
+
+def generate_bits_batch(seeds, output_len=512, p=DEFAULT_P, g=DEFAULT_G) -> np.ndarray:
+    """
+    返回形状为(N, output_len)的uint8数组, 第i行与tiny_random_generator(seeds[i])的输出一致
+    """
+    seeds = list(seeds)
+    bits = np.zeros((len(seeds), output_len), dtype=np.uint8)
+    if not seeds or not output_len:
+        return bits
+    engine = MultiSeedPRG(seeds, p, g)
+    for i in range(output_len):
+        bits[:, i] = engine.step()
+    return bits
+
+
+def first_mismatch_batch(seeds, bits_list, p=DEFAULT_P, g=DEFAULT_G) -> list:
+    """
+    批量版本的core.first_mismatch, 返回值逐项与first_mismatch(seeds[i], bits_list[i])一致
+    所有种子一起前进, 已经出错或比较完毕的种子随即从数组中移除
+    """
+    seeds, bits_list = list(seeds), list(bits_list)
+    if not supports(p):
+        return [first_mismatch(seed, bits, p, g) for seed, bits in zip(seeds, bits_list)]
+
+    count = len(seeds)
+    lengths = np.array([len(bits) for bits in bits_list], dtype=np.int64)
+    max_len = int(lengths.max()) if count else 0
+    # 提交的比特串, 0/1之外的字符记为2(必然不匹配), 超出长度的部分不会被比较
+    submitted = np.full((count, max_len), 2, dtype=np.uint8)
+    for i, bits in enumerate(bits_list):
+        # 非ASCII字符替换为"?", 保证每个字符恰好占一个字节
+        row = np.frombuffer(bits.encode("ascii", "replace"), dtype=np.uint8) - ord("0")
+        submitted[i, :len(row)] = np.where(row <= 1, row, 2)
+    expected = np.zeros((count, max_len), dtype=np.uint8)
+    mismatch_index = np.full(count, -1, dtype=np.int64)
+
+    active = np.flatnonzero(lengths > 0)
+    engine = MultiSeedPRG([seeds[i] for i in active], p, g) if len(active) else None
+    step = 0
+    while len(active):
+        bits = engine.step()
+        expected[active, step] = bits
+        mismatched = submitted[active, step] != bits
+        mismatch_index[active[mismatched]] = step
+        keep = ~mismatched & (lengths[active] > step + 1)
+        if not keep.all():
+            engine.select(keep)
+            active = active[keep]
+        step += 1
+
+    results = []
+    for i in range(count):
+        end = lengths[i] if mismatch_index[i] < 0 else mismatch_index[i] + 1
+        prefix = "".join("1" if bit else "0" for bit in expected[i, :end])
+        results.append((None if mismatch_index[i] < 0 else int(mismatch_index[i]), prefix))
+    return results
+
+
+def test():
+    import secrets
+
+    from app.main.prg.core import tiny_random_generator
+
+    seeds = [0, 1, 2, 20214876, 2 ** 70 + 3] + [secrets.randbelow(10 ** 8) for _ in range(50)]
+    bits = generate_bits_batch(seeds, 300)
+    for seed, row in zip(seeds, bits):
+        assert "".join(map(str, row)) == tiny_random_generator(seed, output_len=300)[0]
+
+    # p < 2^63时不需要处理进位, 同样应该正确
+    small_p, small_g = 4294967311, 5
+    bits = generate_bits_batch(seeds, 64, small_p, small_g)
+    for seed, row in zip(seeds, bits):
+        assert "".join(map(str, row)) == tiny_random_generator(seed, small_p, small_g, 64)[0]
+
+    submissions = []
+    for i, seed in enumerate(seeds):
+        z_str = tiny_random_generator(seed)[0]
+        if i % 3 == 1:
+            z_str = z_str[:i] + ("0" if z_str[i] == "1" else "1") + z_str[i + 1:]
+        elif i % 3 == 2:
+            z_str = z_str[:i] + "x" + z_str[i + 1:]
+        submissions.append(z_str)
+    submissions[0] = ""
+    submissions[3] = submissions[3][:100]
+    submissions[4] = submissions[4][:5] + "é" + submissions[4][6:]  # 非ASCII字符
+    assert first_mismatch_batch(seeds, submissions) == [first_mismatch(seed, bits)
+                                                       for seed, bits in zip(seeds, submissions)]
+    assert first_mismatch_batch([], []) == []
+    assert first_mismatch_batch([7], ["01"], 2 ** 64 + 13, 3) == [first_mismatch(7, "01", 2 ** 64 + 13, 3)]
+
+
+def benchmark(number=1000, output_len=512):
+    import secrets
+    import time
+
+    from app.main.prg.core import tiny_random_generator
+
+    seeds = [secrets.randbelow(10 ** 8) for _ in range(number)]
+    _window_table(DEFAULT_P, DEFAULT_G, WINDOW_BITS)  # 建表开销只在第一次出现
+
+    start = time.perf_counter()
+    scalar = [tiny_random_generator(seed, output_len=output_len)[0] for seed in seeds]
+    scalar_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = generate_bits_batch(seeds, output_len)
+    batch_time = time.perf_counter() - start
+
+    assert ["".join(map(str, row)) for row in batch] == scalar
+    print("{} seeds x {} bits".format(number, output_len))
+    print("scalar loop:  {:.3f}s".format(scalar_time))
+    print("batch engine: {:.3f}s".format(batch_time))
+    print("speedup:      {:.2f}x".format(scalar_time / batch_time))
+
+
+if __name__ == '__main__':
+    test()
+    benchmark()
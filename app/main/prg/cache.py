@@ -0,0 +1,152 @@
+"""
+PRG结果缓存
+p, g, 输出长度固定时, 输出只取决于种子, 而同学们会用同一个种子(学号)反复请求
+缓存分两层: 进程内的LRU, 以及web/db.py中所有gunicorn worker共享的Redis
+访问Redis使用单独的、超时很短且不重试的客户端; Redis不可用时暂停访问一段时间, 期间只使用进程内缓存, 不影响正常计算
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from itertools import islice
+
+from app.main.prg.core import DEFAULT_P, DEFAULT_G, iter_bits, iter_bytes, iter_states
+from redis import Redis
+from web.db import redis, RedisError
+
+# 进程内LRU的容量
+LOCAL_CACHE_SIZE = int(os.environ.get("PRG_CACHE_SIZE", "4096"))
+# Redis中缓存的过期时间(秒)
+REDIS_TTL = int(os.environ.get("PRG_CACHE_TTL", str(7 * 24 * 3600)))
+# Redis出错后暂停访问的时间(秒)
+REDIS_RETRY_INTERVAL = 30
+# 连接和读写Redis的超时(秒), Redis不可用时请求最多等待这么久就退回进程内缓存
+REDIS_TIMEOUT = float(os.environ.get("PRG_CACHE_REDIS_TIMEOUT", "0.2"))
+
+
+def _make_backend(shared: Redis, timeout: float = REDIS_TIMEOUT) -> Redis:
+    """连接与web/db.py相同的Redis, 但使用较短的超时且不重试, 缓存只是加速手段, 不值得让请求等待"""
+    kwargs = shared.connection_pool.connection_kwargs
+    return Redis(host=kwargs.get("host", "localhost"),
+                 port=kwargs.get("port", 6379),
+                 db=kwargs.get("db", 0),
+                 password=kwargs.get("password"),
+                 socket_connect_timeout=timeout,
+                 socket_timeout=timeout,
+                 retry=None)
+
+
+class PRGCache:
+    def __init__(self, backend, size: int = LOCAL_CACHE_SIZE):
+        self.backend = backend
+        self.size = size
+        self._lock = threading.Lock()
+        self._local = OrderedDict()
+        self._backend_down_until = 0.0
+
+    def bits(self, seed: int, p: int = DEFAULT_P, g: int = DEFAULT_G, length: int = 512) -> str:
+        """输出的01字符串, 与tiny_random_generator的z_str相同"""
+        packed = self._get(("bits", seed, p, g, length),
+                           lambda: b"".join(iter_bytes(seed, p, g, length)))
+        return self._unpack_bits(packed, length)
+
+    def lookup_bits(self, seed: int, p: int = DEFAULT_P, g: int = DEFAULT_G, length: int = 512):
+        """只查缓存, 未命中时返回None"""
+        packed = self._lookup(("bits", seed, p, g, length))
+        return None if packed is None else self._unpack_bits(packed, length)
+
+    def store_bits(self, seed: int, z_str: str, p: int = DEFAULT_P, g: int = DEFAULT_G):
+        """存入已经确认正确的输出"""
+        padding = -len(z_str) % 8  # 与iter_bytes一致, 末字节低位补0
+        packed = (int(z_str, 2) << padding).to_bytes((len(z_str) + padding) // 8, "big") if z_str else b""
+        self._store(("bits", seed, p, g, len(z_str)), packed)
+
+    def states(self, seed: int, p: int = DEFAULT_P, g: int = DEFAULT_G, length: int = 64) -> list:
+        """状态序列s1, ..., s_length"""
+        width = (p.bit_length() + 7) // 8
+        packed = self._get(("states", seed, p, g, length),
+                           lambda: b"".join(s.to_bytes(width, "big")
+                                            for s in islice(iter_states(seed, p, g), length)))
+        return [int.from_bytes(packed[i:i + width], "big") for i in range(0, len(packed), width)]
+
+    @staticmethod
+    def _unpack_bits(packed: bytes, length: int) -> str:
+        return bin(int.from_bytes(packed, "big"))[2:].zfill(len(packed) * 8)[:length]
+
+    def _get(self, key: tuple, compute) -> bytes:
+        value = self._lookup(key)
+        if value is None:
+            value = compute()
+            self._store(key, value)
+        return value
+
+    def _lookup(self, key: tuple):
+        with self._lock:
+            value = self._local.get(key)
+            if value is not None:
+                self._local.move_to_end(key)
+                return value
+
+        value = self._backend_call(self.backend.get, self._redis_key(key))
+        if value is not None:
+            self._store_local(key, value)
+        return value
+
+    def _store(self, key: tuple, value: bytes):
+        self._store_local(key, value)
+        self._backend_call(self.backend.set, self._redis_key(key), value, ex=REDIS_TTL)
+
+    def _store_local(self, key: tuple, value: bytes):
+        with self._lock:
+            self._local[key] = value
+            self._local.move_to_end(key)
+            while len(self._local) > self.size:
+                self._local.popitem(last=False)
+
+    @staticmethod
+    def _redis_key(key: tuple) -> str:
+        return "prg:" + ":".join(map(str, key))
+
+    def _backend_call(self, func, *args, **kwargs):
+        if time.monotonic() < self._backend_down_until:
+            return None
+        try:
+            return func(*args, **kwargs)
+        except RedisError:
+            self._backend_down_until = time.monotonic() + REDIS_RETRY_INTERVAL
+            return None
+
+
+prg_cache = PRGCache(_make_backend(redis))
+
+
+def test():
+    from app.main.prg.core import tiny_random_generator
+
+    class DictBackend(dict):
+        def set(self, key, value, ex=None):
+            self[key] = value
+
+    backend = DictBackend()
+    cache = PRGCache(backend, size=2)
+    for seed in (0, 1, 20214876):
+        z_str, _, detailed_output = tiny_random_generator(seed, output_len=64, detailed=True)
+        assert cache.bits(seed, length=64) == z_str
+        assert cache.bits(seed, length=13) == z_str[:13]
+        assert cache.states(seed) == [int(si) for _, si, _ in detailed_output[1:]]
+    assert len(backend) == 9 and len(cache._local) == 2
+
+    cache = PRGCache(DictBackend())
+    assert cache.lookup_bits(7, length=13) is None
+    cache.store_bits(7, tiny_random_generator(7, output_len=13)[0])
+    assert cache.lookup_bits(7, length=13) == tiny_random_generator(7, output_len=13)[0]
+
+    cache = PRGCache(backend, size=2)  # 新进程, 从共享缓存中读取
+    assert cache.bits(20214876, length=64) == tiny_random_generator(20214876, output_len=64)[0]
+    start = time.monotonic()
+    assert "".join(str(bit) for bit in iter_bits(5, output_len=512)) == PRGCache(_make_backend(redis)).bits(5)  # Redis不可用
+    assert time.monotonic() - start < 2 * REDIS_TIMEOUT + 1
+
+
+if __name__ == '__main__':
+    test()
@@ -1,30 +1,123 @@
+from itertools import islice
+
+from app.main.arith import powmod
+
+DEFAULT_P = 13835075647472402443
+DEFAULT_G = 12332102632472395673
+
+# iter_bytes每次产生的字节数
+BYTES_CHUNK_SIZE = 8192
+
+
+def iter_states(seed, p=DEFAULT_P, g=DEFAULT_G):
+    """
+    惰性产生状态序列 s1, s2, ..., 其中 s_i = g^s_{i-1} mod p, s_0 = seed
+    """
+    s = seed
+    while True:
+        s = powmod(g, s, p)
+        yield s
+
+
+def iter_bits(seed, p=DEFAULT_P, g=DEFAULT_G, output_len=None):
+    """
+    惰性产生输出比特 z_i = s_i & 1
+    @param output_len 输出的比特数, 为None时无限产生
+    """
+    bits = (s & 1 for s in iter_states(seed, p, g))
+    return bits if output_len is None else islice(bits, output_len)
+
+
+def iter_bytes(seed, p=DEFAULT_P, g=DEFAULT_G, output_len=512, chunk_size=BYTES_CHUNK_SIZE):
+    """
+    将输出比特按高位在前打包成字节, 每次产生至多chunk_size字节
+    @param output_len 输出的比特数, 不是8的倍数时最后一个字节的低位补0
+    """
+    chunk = bytearray()
+    byte, count = 0, 0
+    for bit in iter_bits(seed, p, g, output_len):
+        byte = (byte << 1) | bit
+        count += 1
+        if count == 8:
+            chunk.append(byte)
+            byte, count = 0, 0
+            if len(chunk) == chunk_size:
+                yield bytes(chunk)
+                chunk.clear()
+    if count:
+        chunk.append(byte << (8 - count))
+    if chunk:
+        yield bytes(chunk)
+
+
+def first_mismatch(seed, bits: str, p=DEFAULT_P, g=DEFAULT_G):
+    """
+    逐比特生成输出并与bits比较, 遇到第一个不一致的比特即停止
+    返回: (第一个不一致的比特下标, 截至该比特(含)的正确输出); 全部一致时下标为None
+    """
+    expected = []
+    for i, bit in enumerate(iter_bits(seed, p, g, len(bits))):
+        expected.append("1" if bit else "0")
+        if bits[i] != expected[-1]:
+            return i, "".join(expected)
+    return None, "".join(expected)
+
+
 def tiny_random_generator(seed,
-                          p=13835075647472402443,
-                          g=12332102632472395673,
+                          p=DEFAULT_P,
+                          g=DEFAULT_G,
                           output_len=512,
                           detailed=False):
     """
     @param detailed 是否输出详细的中间数据
     """
-    s_old = seed
-    z_str = ""
-    z_int = 0
     detailed_output = []
-    if detailed:
+    if not detailed:
+        z_str = "".join("1" if bit else "0" for bit in iter_bits(seed, p, g, output_len))
+    else:
         detailed_output.append((0, str(seed)))
+        bits = []
+        for i, si in enumerate(islice(iter_states(seed, p, g), output_len)):
+            bits.append("1" if si & 1 else "0")
+            detailed_output.append((i + 1, str(si), si & 1))
+        z_str = "".join(bits)
+    z_int = int(z_str, 2) if z_str else 0
 
+    return z_str, z_int, detailed_output
+
+
+def _tiny_random_generator_reference(seed, p=DEFAULT_P, g=DEFAULT_G, output_len=512):
+    """重构前的实现, 用于测试"""
+    s_old = seed
+    z_str = ""
+    z_int = 0
     for i in range(output_len):
         z_int <<= 1
         si = pow(g, s_old, p)
         s_old = si
         z_str += str(si & 1)
         z_int += (si & 1)
-        if detailed:
-            detailed_output.append((i + 1, str(si), si & 1))
+    return z_str, z_int
 
-    return z_str, z_int, detailed_output
+
+def test():
+    for seed in (0, 1, 20214876, 2 ** 70):
+        for output_len in (0, 1, 7, 64, 512):
+            z_str, z_int, _ = tiny_random_generator(seed, output_len=output_len)
+            assert (z_str, z_int) == _tiny_random_generator_reference(seed, output_len=output_len)
+            packed = b"".join(iter_bytes(seed, output_len=output_len, chunk_size=3))
+            assert len(packed) == (output_len + 7) // 8
+            if output_len:
+                assert int.from_bytes(packed, "big") == z_int << (len(packed) * 8 - output_len)
+    z_str, _, _ = tiny_random_generator(20214876)
+    assert first_mismatch(20214876, z_str) == (None, z_str)
+    wrong = z_str[:100] + ("0" if z_str[100] == "1" else "1") + z_str[101:]
+    assert first_mismatch(20214876, wrong) == (100, z_str[:101])
+    z_str, _, detailed_output = tiny_random_generator(20214876, output_len=64, detailed=True)
+    assert len(detailed_output) == 65 and "".join(str(z) for _, _, z in detailed_output[1:]) == z_str
 
 
 if __name__ == '__main__':
+    test()
     print(tiny_random_generator(20214876, detailed=True))
     # print(binpow(g, seed, p))
@@ -1,8 +1,29 @@
-from flask import request, jsonify
+from flask import request, jsonify, Response
 from flask_cors import cross_origin
 
 from app.main import main
-from app.main.prg.core import tiny_random_generator
+from app.main.prg.answer_index import load_answer_index
+from app.main.prg.batch import first_mismatch_batch
+from app.main.prg.cache import prg_cache
+from app.main.prg.core import iter_bits, iter_bytes, first_mismatch
+from app.main.tools import MAX_BATCH_SIZE
+
+# /crypto/prg/stream单次最多输出的比特数
+MAX_STREAM_BITS = 1 << 24
+# 以01字符串输出时每块的字符数
+BITS_CHUNK_SIZE = 8192
+
+# 按花名册预先计算的答案, 启动时映射到内存, 未配置PRG_ANSWER_INDEX时为None
+answer_index = load_answer_index()
+
+
+def _compare_with_packed(bits: str, packed: bytes):
+    """将提交的比特串与打包好的正确输出比较, 返回值同first_mismatch"""
+    if bits.strip("01") == "" and int(bits, 2).to_bytes(len(packed), "big") == packed:
+        return None, bits
+    expected = bin(int.from_bytes(packed, "big"))[2:].zfill(len(bits))
+    mismatch_index = next(i for i, (a, b) in enumerate(zip(bits, expected)) if a != b)
+    return mismatch_index, expected[:mismatch_index + 1]
 
 
 @main.route('/crypto/prg/check', methods=["POST"])
@@ -14,6 +35,8 @@ def check_result():
     :return: json
     - success: 运行状态
     - matched: 结果是否匹配
+    - mismatch_index: 不匹配时, 第一个错误比特的下标(从0开始)
+    - expected_prefix: 不匹配时, 截至第一个错误比特(含)的正确输出
     """
     seed = request.form.get('seed')
     bits = request.form.get('bits')
@@ -29,12 +52,70 @@ def check_result():
 
     try:
         seed = int(seed)
-        result, _, _ = tiny_random_generator(seed)
-        return jsonify(success=True, matched=(result == bits))
+        packed = answer_index.lookup(seed) if answer_index is not None else None
+        expected = prg_cache.lookup_bits(seed) if packed is None else None
+        if packed is not None:
+            mismatch_index, expected_prefix = _compare_with_packed(bits, packed)
+        elif expected is None:
+            # 逐比特比较, 遇到第一个错误即停止, 不必算完全部512个状态; 完全正确时顺便写入缓存
+            mismatch_index, expected_prefix = first_mismatch(seed, bits)
+            if mismatch_index is None:
+                prg_cache.store_bits(seed, bits)
+        else:
+            mismatch_index = next((i for i, (a, b) in enumerate(zip(bits, expected)) if a != b), None)
+            expected_prefix = expected if mismatch_index is None else expected[:mismatch_index + 1]
+        if mismatch_index is None:
+            return jsonify(success=True, matched=True)
+        return jsonify(success=True, matched=False, mismatch_index=mismatch_index, expected_prefix=expected_prefix)
     except Exception as e:
         return jsonify(success=False, reason="程序内部错误:{}".format(e))
 
 
+@main.route('/crypto/prg/check_batch', methods=["POST"])
+@cross_origin()
+def check_batch():
+    """
+    批量校验结果, 所有种子并行计算
+    参数：json
+    - items: 列表, 每项包含seed, bits, 要求与/crypto/prg/check相同
+    :return: json
+    - success: 运行状态
+    - results: 与items顺序一致的列表, 每项的字段与/crypto/prg/check的返回值相同
+    """
+    post_data = request.get_json(silent=True) or {}
+    items = post_data.get('items')
+    if not isinstance(items, list):
+        return jsonify(success=False, reason="参数不全")
+    if len(items) > MAX_BATCH_SIZE:
+        return jsonify(success=False, reason="单次最多校验{}个结果".format(MAX_BATCH_SIZE))
+
+    results = [None] * len(items)
+    seeds, bits_list, indices = [], [], []
+    for i, item in enumerate(items):
+        seed = item.get('seed') if isinstance(item, dict) else None
+        bits = item.get('bits') if isinstance(item, dict) else None
+        if not isinstance(seed, str) or not isinstance(bits, str):
+            results[i] = dict(success=False, reason="参数不全")
+        elif not seed.isdigit():
+            results[i] = dict(success=False, reason="seed不是十进制整数")
+        elif len(bits) != 512:
+            results[i] = dict(success=False, reason="输出的比特串的长度不是512比特")
+        else:
+            seeds.append(int(seed))
+            bits_list.append(bits)
+            indices.append(i)
+
+    try:
+        for i, (mismatch_index, expected_prefix) in zip(indices, first_mismatch_batch(seeds, bits_list)):
+            if mismatch_index is None:
+                results[i] = dict(success=True, matched=True)
+            else:
+                results[i] = dict(success=True, matched=False,
+                                  mismatch_index=mismatch_index, expected_prefix=expected_prefix)
+    except Exception as e:
+        return jsonify(success=False, reason="程序内部错误:{}".format(e))
+    return jsonify(success=True, results=results)
+
 @main.route('/crypto/prg/detailed_output_prev_64bits', methods=["POST"])
 @cross_origin()
 def detailed_output_prev_64bits():
@@ -55,7 +136,51 @@ def detailed_output_prev_64bits():
 
     try:
         seed = int(seed)
-        result, _, detailed_output = tiny_random_generator(seed, output_len=64, detailed=True)
+        detailed_output = [(0, str(seed))]
+        for i, si in enumerate(prg_cache.states(seed, length=64)):
+            detailed_output.append((i + 1, str(si), si & 1))
         return jsonify(success=True, detailed_output=detailed_output)
     except Exception as e:
         return jsonify(success=False, reason="程序内部错误:{}".format(e))
+
+
+def _iter_bit_chunks(seed, output_len):
+    chunk = []
+    for bit in iter_bits(seed, output_len=output_len):
+        chunk.append("1" if bit else "0")
+        if len(chunk) == BITS_CHUNK_SIZE:
+            yield "".join(chunk)
+            chunk.clear()
+    if chunk:
+        yield "".join(chunk)
+
+
+@main.route('/crypto/prg/stream', methods=["GET", "POST"])
+@cross_origin()
+def stream_output():
+    """
+    以分块传输的方式输出任意长度的比特流, 用于统计测试等需要大量输出的场合
+    参数：查询参数或表单
+    - seed: 十进制种子
+    - length: 输出的比特数, 默认为512, 最多为MAX_STREAM_BITS
+    - format: bits(默认, 返回text/plain的01字符串) / bytes(返回application/octet-stream, 高位在前, 末字节低位补0)
+    """
+    seed = request.values.get('seed')
+    length = request.values.get('length', '512')
+    output_format = request.values.get('format', 'bits')
+
+    if seed is None:
+        return jsonify(success=False, reason="参数不全")
+
+    if not seed.isdigit():
+        return jsonify(success=False, reason="seed不是十进制整数")
+
+    if not length.isdigit() or int(length) > MAX_STREAM_BITS:
+        return jsonify(success=False, reason="length应为不超过{}的十进制整数".format(MAX_STREAM_BITS))
+
+    seed, length = int(seed), int(length)
+    if output_format == "bits":
+        return Response(_iter_bit_chunks(seed, length), mimetype="text/plain")
+    if output_format == "bytes":
+        return Response(iter_bytes(seed, output_len=length), mimetype="application/octet-stream")
+    return jsonify(success=False, reason="format只能是bits或bytes")
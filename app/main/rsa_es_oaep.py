@@ -1,18 +1,21 @@
+import functools
 import hashlib
 import os
 
+from .hash_registry import digest_size_of, label_hash, resolve_hash
 from .tools import bytes_xor, hex2
-from .rsa_raw import RSAEnc, RSADec
+from .rsa_raw import RSAEnc, RSADec, DEFAULT_E
 from .mgf import mgf1
+from .pool import get_process_pool, POOL_WORKERS
 
 
 def oaep_encode(M: bytes, label: bytes = b"", hash_func=hashlib.sha256, mgf_hash_func=hashlib.sha256) -> bytes:
     # 定义长度参数
     mLen = len(M)
     k = 256
-    hLen = hash_func().digest_size
+    hLen = digest_size_of(hash_func)
 
-    lHash = hash_func(label).digest()
+    lHash = label_hash(hash_func, label)
     PS = b"\x00" * (k - mLen - 2 * hLen - 2)
     DB = lHash + PS + b"\x01" + M
 
@@ -29,9 +32,9 @@ def oaep_encode(M: bytes, label: bytes = b"", hash_func=hashlib.sha256, mgf_hash
 def oaep_decode(EM: bytes, label: bytes = b"", hash_func=hashlib.sha256, mgf_hash_func=hashlib.sha256):
     # 定义长度参数
     k = 256
-    hLen = hash_func().digest_size
+    hLen = digest_size_of(hash_func)
 
-    lHash = hash_func(label).digest()
+    lHash = label_hash(hash_func, label)
     Y, maskedSeed, maskedDB = EM[:1], EM[1:1 + hLen], EM[1 + hLen:]
     seedMask = mgf1(maskedDB, hLen, mgf_hash_func)
     seed = bytes_xor(maskedSeed, seedMask)
@@ -58,9 +61,10 @@ def RSAOAEPEnc(m: bytes, n: int, e: int, l: bytes = b"", hash_func=hashlib.sha25
     return hex2(c_int)
 
 
-def RSAOAEPDec(c: bytes, n: int, d: int, l: bytes = b"", hash_func=hashlib.sha256, mgf1_hash_func=hashlib.sha256):
+def RSAOAEPDec(c: bytes, n: int, d: int, l: bytes = b"", hash_func=hashlib.sha256, mgf1_hash_func=hashlib.sha256,
+               e: int = DEFAULT_E, p: int = None, q: int = None):
     c_int = int.from_bytes(c, "big")
-    plain_text_int = RSADec(c_int, n, d)
+    plain_text_int = RSADec(c_int, n, d, e, p, q)
     plain_text_bytes = plain_text_int.to_bytes(256, "big")
     msg = oaep_decode(plain_text_bytes, l,
                       hash_func=hash_func,
@@ -68,6 +72,47 @@ def RSAOAEPDec(c: bytes, n: int, d: int, l: bytes = b"", hash_func=hashlib.sha25
     return msg
 
 
+def _enc_job(m: bytes, n: int, e: int, l: bytes, hash_name: str, mgf1_hash_name: str):
+    return RSAOAEPEnc(m, n, e, l,
+                      hash_func=resolve_hash(hash_name).constructor,
+                      mgf1_hash_func=resolve_hash(mgf1_hash_name).constructor)
+
+
+def _dec_job(c: bytes, n: int, d: int, l: bytes, hash_name: str, mgf1_hash_name: str, e: int):
+    try:
+        return RSAOAEPDec(c, n, d, l,
+                          hash_func=resolve_hash(hash_name).constructor,
+                          mgf1_hash_func=resolve_hash(mgf1_hash_name).constructor,
+                          e=e)
+    except (IndexError, ValueError):  # 解码失败
+        return None
+
+
+def _chunk_size(count: int) -> int:
+    return max(1, count // (4 * POOL_WORKERS))
+
+
+def RSAOAEPEncBatch(messages: list, n: int, e: int, l: bytes = b"",
+                    hash_name: str = "sha256", mgf1_hash_name: str = "sha256") -> list:
+    """
+    批量加密, 在进程池中并行计算
+    hash函数以名称传递, 以便发送到子进程
+    返回: 与messages顺序一致的hex密文列表
+    """
+    job = functools.partial(_enc_job, n=n, e=e, l=l, hash_name=hash_name, mgf1_hash_name=mgf1_hash_name)
+    return list(get_process_pool().map(job, messages, chunksize=_chunk_size(len(messages))))
+
+
+def RSAOAEPDecBatch(ciphers: list, n: int, d: int, l: bytes = b"",
+                    hash_name: str = "sha256", mgf1_hash_name: str = "sha256", e: int = DEFAULT_E) -> list:
+    """
+    批量解密, 在进程池中并行计算
+    返回: 与ciphers顺序一致的明文列表, 解码失败的项为None
+    """
+    job = functools.partial(_dec_job, n=n, d=d, l=l, hash_name=hash_name, mgf1_hash_name=mgf1_hash_name, e=e)
+    return list(get_process_pool().map(job, ciphers, chunksize=_chunk_size(len(ciphers))))
+
+
 def test():
     msg = b"chenjianzhang"
     print("Message:\t", msg)
@@ -1,11 +1,11 @@
-import functools
-
 from flask import request, abort, jsonify
 from flask_cors import cross_origin
 
 from . import main
 from .rsa_es_oaep import *
-from .tools import hex_to_bytes, try_decode_utf8
+from .hash_registry import resolve_hash
+from .oaep_batch import eme_oaep_encode_batch
+from .tools import hex_to_bytes, hex_to_dec_int, try_decode_utf8, MAX_BATCH_SIZE
 
 
 @main.route("/crypto/eme_oaep_encode")
@@ -37,8 +37,9 @@ def eme_oaep_encode():
     mgf1_hash_func_name = request.args.get("mgf1_hash", "sha256")
 
     # 检查哈希函数
-    if hash_func_name.lower() not in hashlib.algorithms_available \
-            or mgf1_hash_func_name.lower() not in hashlib.algorithms_available:
+    hash_info = resolve_hash(hash_func_name)
+    mgf1_hash_info = resolve_hash(mgf1_hash_func_name)
+    if hash_info is None or mgf1_hash_info is None:
         return jsonify(success=False, reason="哈希函数指定错误，请检查参数hash以及mgf1_hash")
 
     # 检查message
@@ -49,7 +50,7 @@ def eme_oaep_encode():
         if message_bytes is None:
             return jsonify(success=False, reason="message解析错误，请检查message是否为合法的hex字符串")
     # 检查消息长度
-    if len(message_bytes) > 256 - 2 * hashlib.new(hash_func_name).digest_size - 2:
+    if len(message_bytes) > hash_info.max_message_length:
         return jsonify(success=False, reason="消息过长")
 
     if label:
@@ -65,8 +66,8 @@ def eme_oaep_encode():
 
 
     rslt_bytes = oaep_encode(message_bytes, label_bytes,
-                             hash_func=functools.partial(hashlib.new, hash_func_name),
-                             mgf_hash_func=functools.partial(hashlib.new, mgf1_hash_func_name))
+                             hash_func=hash_info.constructor,
+                             mgf_hash_func=mgf1_hash_info.constructor)
 
     rslt_hex_str = "0x" + rslt_bytes.hex()
     response = jsonify(encoded_message=rslt_hex_str, success=True)
@@ -110,8 +111,9 @@ def eme_oaep_decode():
     if len(encoded_message_bytes) != 256:
         return jsonify(success=False, reason="所提供的编码后字符串不为256字节")
 
-    if hash_func_name.lower() not in hashlib.algorithms_available \
-            or mgf1_hash_func_name.lower() not in hashlib.algorithms_available:
+    hash_info = resolve_hash(hash_func_name)
+    mgf1_hash_info = resolve_hash(mgf1_hash_func_name)
+    if hash_info is None or mgf1_hash_info is None:
         return jsonify(success=False, reason="哈希函数指定错误，请检查参数hash以及mgf1_hash")
 
     if label:
@@ -125,8 +127,8 @@ def eme_oaep_decode():
         label_bytes = b""
 
     message_bytes = oaep_decode(encoded_message_bytes, label_bytes,
-                                hash_func=functools.partial(hashlib.new, hash_func_name),
-                                mgf_hash_func=functools.partial(hashlib.new, mgf1_hash_func_name))
+                                hash_func=hash_info.constructor,
+                                mgf_hash_func=mgf1_hash_info.constructor)
 
     if message_bytes is None:
         return jsonify(success=False, reason="解码失败，请检查参数")
@@ -138,6 +140,92 @@ def eme_oaep_decode():
     return response
 
 
+@main.route("/crypto/eme_oaep_encode_batch", methods=["POST"])
+@cross_origin()
+def eme_oaep_encode_batch_route():
+    """
+    批量编码, 多条消息的掩码运算一起向量化完成
+    参数：json
+    - messages: utf8/hex 字符串列表
+    - is_message_utf8: (可选) message是否为utf8编码，默认为False
+    - label: (可选) utf8/hex 字符串
+    - is_label_utf8: (可选) label是否为utf8编码, 默认为False
+
+    - hash: OAEP填充过程中的label所用到的Hash函数名称, 默认为SHA256
+    - mgf1_hash: MGF1所用到的Hash函数名称, 默认为SHA256
+    返回：json
+    - success: 是否成功
+    - results: 与messages顺序一致的列表, 每项包含
+        - success: 该项是否成功
+        - encoded_message: 编码后的信息，hex编码
+        - reason: 如果success=False, 失败的理由
+    - reason: 如果success=False, 失败的理由
+    :return:
+    """
+    post_data = request.get_json(silent=True)
+    if not isinstance(post_data, dict):
+        abort(400)
+
+    messages = post_data.get("messages")
+    if not isinstance(messages, list):
+        abort(400)
+    is_message_utf8 = post_data.get("is_message_utf8", "0")
+    label = post_data.get("label")
+    is_label_utf8 = post_data.get("is_label_utf8", "0")
+    hash_func_name = post_data.get("hash", "sha256")
+    mgf1_hash_func_name = post_data.get("mgf1_hash", "sha256")
+
+    # 检查哈希函数
+    hash_info = resolve_hash(hash_func_name)
+    mgf1_hash_info = resolve_hash(mgf1_hash_func_name)
+    if hash_info is None or mgf1_hash_info is None:
+        return jsonify(success=False, reason="哈希函数指定错误，请检查参数hash以及mgf1_hash")
+
+    if len(messages) > MAX_BATCH_SIZE:
+        return jsonify(success=False, reason="单次最多处理{}条消息".format(MAX_BATCH_SIZE))
+
+    if label is not None and not isinstance(label, str):
+        return jsonify(success=False, reason="label不是字符串")
+    if label:
+        if is_label_utf8 == "1":
+            label_bytes = bytes(label, encoding="utf8")
+        else:
+            label_bytes = hex_to_bytes(label)
+            if label_bytes is None:
+                return jsonify(success=False, reason="label解析错误，请检查label是否为合法的hex字符串")
+    else:
+        label_bytes = b""
+
+    # 逐条检查message
+    max_message_len = hash_info.max_message_length
+    results = [None] * len(messages)
+    pending_indices, pending_messages = [], []
+    for i, message in enumerate(messages):
+        if not isinstance(message, str):
+            results[i] = dict(success=False, reason="message不是字符串")
+            continue
+        if is_message_utf8 == "1":
+            message_bytes = bytes(message, encoding="utf8")
+        else:
+            message_bytes = hex_to_bytes(message)
+            if message_bytes is None:
+                results[i] = dict(success=False, reason="message解析错误，请检查message是否为合法的hex字符串")
+                continue
+        if len(message_bytes) > max_message_len:
+            results[i] = dict(success=False, reason="消息过长")
+            continue
+        pending_indices.append(i)
+        pending_messages.append(message_bytes)
+
+    encoded = eme_oaep_encode_batch(pending_messages, label_bytes,
+                                    hash_func=hash_info.constructor,
+                                    mgf_hash_func=mgf1_hash_info.constructor)
+    for i, row in zip(pending_indices, encoded):
+        results[i] = dict(success=True, encoded_message="0x" + row.tobytes().hex())
+
+    return jsonify(success=True, results=results)
+
+
 @main.route("/crypto/rsaes_2048_oaep/enc")
 @cross_origin()
 def rsaes_oaep_enc():
@@ -170,8 +258,9 @@ def rsaes_oaep_enc():
     mgf1_hash_func_name = request.args.get("mgf1_hash", "sha256")
 
     # 检查两个Hash函数是否合法
-    if hash_func_name.lower() not in hashlib.algorithms_available \
-            or mgf1_hash_func_name.lower() not in hashlib.algorithms_available:
+    hash_info = resolve_hash(hash_func_name)
+    mgf1_hash_info = resolve_hash(mgf1_hash_func_name)
+    if hash_info is None or mgf1_hash_info is None:
         return jsonify(success=False, reason="哈希函数指定错误，请检查参数hash以及mgf1_hash")
 
     if message_str is None or n_hex is None or e_hex is None:
@@ -185,7 +274,7 @@ def rsaes_oaep_enc():
         if message_bytes is None:
             return jsonify(success=False, reason="message解析错误，请检查message是否为合法的hex字符串")
     # 检查消息长度
-    if len(message_bytes) > 256 - 2 * hashlib.new(hash_func_name).digest_size - 2:
+    if len(message_bytes) > hash_info.max_message_length:
         return jsonify(success=False, reason="消息过长")
 
     # 处理label
@@ -216,8 +305,8 @@ def rsaes_oaep_enc():
 
     # 合法性检查通过, 开始加密
     cipher_hex = RSAOAEPEnc(message_bytes, n_int, e_int, label_bytes,
-                            hash_func=functools.partial(hashlib.new, hash_func_name),
-                            mgf1_hash_func=functools.partial(hashlib.new, mgf1_hash_func_name)
+                            hash_func=hash_info.constructor,
+                            mgf1_hash_func=mgf1_hash_info.constructor
                             )
     return jsonify(success=True, cipher_bytes=cipher_hex)
 
@@ -230,6 +319,7 @@ def rsaes_oaep_dec():
     - cipher: hex编码的字符串
     - n: hex字符串
     - d: hex字符串
+    - e: (可选) hex字符串, 公钥指数, 用于CRT加速解密, 默认为0x010001
     - label: (可选) utf8/hex 字符串
     - is_label_utf8: (可选) label是否为utf8编码, 默认为False
 
@@ -253,8 +343,9 @@ def rsaes_oaep_dec():
     mgf1_hash_func_name = request.args.get("mgf1_hash", "sha256")
 
     # 检查两个Hash函数是否合法
-    if hash_func_name.lower() not in hashlib.algorithms_available \
-            or mgf1_hash_func_name.lower() not in hashlib.algorithms_available:
+    hash_info = resolve_hash(hash_func_name)
+    mgf1_hash_info = resolve_hash(mgf1_hash_func_name)
+    if hash_info is None or mgf1_hash_info is None:
         return jsonify(success=False, reason="哈希函数指定错误，请检查参数hash以及mgf1_hash")
 
     if cipher_hex is None or n_hex is None or d_hex is None:
@@ -296,10 +387,20 @@ def rsaes_oaep_dec():
     if d_int >= n_int:
         return jsonify(success=False, reason="d >= n，请检查参数")
 
+    # 处理e(可选)
+    e_hex = request.args.get("e")
+    if e_hex is None:
+        e_int = DEFAULT_E
+    else:
+        e_int = hex_to_dec_int(e_hex)
+        if e_int is None:
+            return jsonify(success=False, reason="e解析错误，请检查e是否为合法的hex字符串")
+
     # 合法性检查通过, 开始解密
     message_bytes = RSAOAEPDec(cipher_bytes, n_int, d_int, label_bytes,
-                               hash_func=functools.partial(hashlib.new, hash_func_name),
-                               mgf1_hash_func=functools.partial(hashlib.new, mgf1_hash_func_name)
+                               hash_func=hash_info.constructor,
+                               mgf1_hash_func=mgf1_hash_info.constructor,
+                               e=e_int
                                )
 
     if message_bytes is None:
@@ -307,3 +408,231 @@ def rsaes_oaep_dec():
     # 尝试解析信息为utf8
     message_utf8 = try_decode_utf8(message_bytes)
     return jsonify(success=True, message_bytes="0x" + message_bytes.hex(), message_utf8=message_utf8)
+
+
+@main.route("/crypto/rsaes_2048_oaep/enc_batch", methods=["POST"])
+@cross_origin()
+def rsaes_oaep_enc_batch():
+    """
+    批量加密, 同一公钥下的多条消息在进程池中并行加密
+    参数：json
+    - messages: utf8/hex 字符串列表
+    - is_message_utf8: (可选) message是否为utf8编码，默认为False
+    - n: hex字符串
+    - e: hex字符串
+    - label: (可选) utf8/hex 字符串
+    - is_label_utf8: (可选) label是否为utf8编码, 默认为False
+
+    - hash: OAEP填充过程中的label所用到的Hash函数名称, 默认为SHA256
+    - mgf1_hash: MGF1所用到的Hash函数名称, 默认为SHA256
+
+    返回：json
+    - success: 是否成功
+    - results: 与messages顺序一致的列表, 每项包含
+        - success: 该项是否成功
+        - cipher_bytes: hex编码的密文
+        - reason: 如果success=False, 失败的理由
+    - reason: 如果success=False, 失败的理由
+    :return:
+    """
+    post_data = request.get_json(silent=True)
+    if not isinstance(post_data, dict):
+        abort(400)
+
+    messages = post_data.get("messages")
+    is_message_utf8 = post_data.get("is_message_utf8", "0")
+    n_hex = post_data.get("n")
+    e_hex = post_data.get("e")
+    label_str = post_data.get("label")
+    is_label_utf8 = post_data.get("is_label_utf8", "0")
+
+    hash_func_name = post_data.get("hash", "sha256")
+    mgf1_hash_func_name = post_data.get("mgf1_hash", "sha256")
+
+    # 检查两个Hash函数是否合法
+    hash_info = resolve_hash(hash_func_name)
+    mgf1_hash_info = resolve_hash(mgf1_hash_func_name)
+    if hash_info is None or mgf1_hash_info is None:
+        return jsonify(success=False, reason="哈希函数指定错误，请检查参数hash以及mgf1_hash")
+
+    if not isinstance(messages, list) or n_hex is None or e_hex is None:
+        abort(400)
+    if len(messages) > MAX_BATCH_SIZE:
+        return jsonify(success=False, reason="单次最多处理{}条消息".format(MAX_BATCH_SIZE))
+
+    # 处理label
+    if label_str is not None and not isinstance(label_str, str):
+        return jsonify(success=False, reason="label不是字符串")
+    if label_str:
+        if is_label_utf8 == "1":
+            label_bytes = bytes(label_str, encoding="utf8")
+        else:
+            label_bytes = hex_to_bytes(label_str)
+            if label_bytes is None:
+                return jsonify(success=False, reason="label解析错误，请检查label是否为合法的hex字符串")
+    else:
+        label_bytes = b""
+
+    # 处理n, e
+    n_bytes = hex_to_bytes(n_hex)
+    e_bytes = hex_to_bytes(e_hex)
+
+    # 合法性检查
+    if n_bytes is None:
+        return jsonify(success=False, reason="n解析错误，请检查n是否为合法的hex字符串")
+    if e_bytes is None:
+        return jsonify(success=False, reason="e解析错误，请检查e是否为合法的hex字符串")
+
+    n_int = int.from_bytes(n_bytes, byteorder="big")
+    e_int = int.from_bytes(e_bytes, byteorder="big")
+    if e_int >= n_int:
+        return jsonify(success=False, reason="e >= n，请检查参数")
+
+    # 逐条处理message, 不合法的条目直接记录失败原因
+    max_message_len = hash_info.max_message_length
+    results = [None] * len(messages)
+    pending_indices, pending_messages = [], []
+    for i, message_str in enumerate(messages):
+        if not isinstance(message_str, str):
+            results[i] = dict(success=False, reason="message不是字符串")
+            continue
+        if is_message_utf8 == "1":
+            message_bytes = bytes(message_str, encoding="utf8")
+        else:
+            message_bytes = hex_to_bytes(message_str)
+            if message_bytes is None:
+                results[i] = dict(success=False, reason="message解析错误，请检查message是否为合法的hex字符串")
+                continue
+        if len(message_bytes) > max_message_len:
+            results[i] = dict(success=False, reason="消息过长")
+            continue
+        pending_indices.append(i)
+        pending_messages.append(message_bytes)
+
+    # 合法性检查通过, 开始加密
+    cipher_hex_list = RSAOAEPEncBatch(pending_messages, n_int, e_int, label_bytes,
+                                      hash_name=hash_info.name,
+                                      mgf1_hash_name=mgf1_hash_info.name)
+    for i, cipher_hex in zip(pending_indices, cipher_hex_list):
+        results[i] = dict(success=True, cipher_bytes=cipher_hex)
+
+    return jsonify(success=True, results=results)
+
+
+@main.route("/crypto/rsaes_2048_oaep/dec_batch", methods=["POST"])
+@cross_origin()
+def rsaes_oaep_dec_batch():
+    """
+    批量解密, 同一私钥下的多条密文在进程池中并行解密
+    参数：json
+    - ciphers: hex编码的字符串列表
+    - n: hex字符串
+    - d: hex字符串
+    - e: (可选) hex字符串, 公钥指数, 用于CRT加速解密, 默认为0x010001
+    - label: (可选) utf8/hex 字符串
+    - is_label_utf8: (可选) label是否为utf8编码, 默认为False
+
+    - hash: OAEP填充过程中的label所用到的Hash函数名称, 默认为SHA256
+    - mgf1_hash: MGF1所用到的Hash函数名称, 默认为SHA256
+
+    返回：json
+    - success: 是否成功
+    - results: 与ciphers顺序一致的列表, 每项包含
+        - success: 该项是否成功
+        - message_bytes: hex编码的明文
+        - message_utf8:（如果解码成功）UTF-8编码的明文
+        - reason: 如果success=False, 失败的理由
+    - reason: 如果success=False, 失败的理由
+    :return:
+    """
+    post_data = request.get_json(silent=True)
+    if not isinstance(post_data, dict):
+        abort(400)
+
+    ciphers = post_data.get("ciphers")
+    n_hex = post_data.get("n")
+    d_hex = post_data.get("d")
+    e_hex = post_data.get("e")
+    label_str = post_data.get("label")
+    is_label_utf8 = post_data.get("is_label_utf8", "0")
+
+    hash_func_name = post_data.get("hash", "sha256")
+    mgf1_hash_func_name = post_data.get("mgf1_hash", "sha256")
+
+    # 检查两个Hash函数是否合法
+    hash_info = resolve_hash(hash_func_name)
+    mgf1_hash_info = resolve_hash(mgf1_hash_func_name)
+    if hash_info is None or mgf1_hash_info is None:
+        return jsonify(success=False, reason="哈希函数指定错误，请检查参数hash以及mgf1_hash")
+
+    if not isinstance(ciphers, list) or n_hex is None or d_hex is None:
+        abort(400)
+    if len(ciphers) > MAX_BATCH_SIZE:
+        return jsonify(success=False, reason="单次最多处理{}条密文".format(MAX_BATCH_SIZE))
+
+    # 处理label
+    if label_str is not None and not isinstance(label_str, str):
+        return jsonify(success=False, reason="label不是字符串")
+    if label_str:
+        if is_label_utf8 == "1":
+            label_bytes = bytes(label_str, encoding="utf8")
+        else:
+            label_bytes = hex_to_bytes(label_str)
+            if label_bytes is None:
+                return jsonify(success=False, reason="label解析错误，请检查label是否为合法的hex字符串")
+    else:
+        label_bytes = b""
+
+    n_bytes = hex_to_bytes(n_hex)
+    d_bytes = hex_to_bytes(d_hex)
+
+    # n, d合法性检查
+    if n_bytes is None:
+        return jsonify(success=False, reason="n解析错误，请检查n是否为合法的hex字符串")
+    if d_bytes is None:
+        return jsonify(success=False, reason="d解析错误，请检查d是否为合法的hex字符串")
+
+    if len(n_bytes) != 256:
+        return jsonify(success=False, reason="n的长度不等于256字节（2048bit）")
+
+    n_int = int.from_bytes(n_bytes, byteorder="big")
+    d_int = int.from_bytes(d_bytes, byteorder="big")
+    if d_int >= n_int:
+        return jsonify(success=False, reason="d >= n，请检查参数")
+
+    # 处理e(可选)
+    if e_hex is None:
+        e_int = DEFAULT_E
+    else:
+        e_int = hex_to_dec_int(e_hex)
+        if e_int is None:
+            return jsonify(success=False, reason="e解析错误，请检查e是否为合法的hex字符串")
+
+    # 逐条检查cipher
+    results = [None] * len(ciphers)
+    pending_indices, pending_ciphers = [], []
+    for i, cipher_hex in enumerate(ciphers):
+        cipher_bytes = hex_to_bytes(cipher_hex) if isinstance(cipher_hex, str) else None
+        if cipher_bytes is None:
+            results[i] = dict(success=False, reason="cipher解析错误，请检查cipher是否为合法的hex字符串")
+            continue
+        if len(cipher_bytes) > 256:
+            results[i] = dict(success=False, reason="密文长度大于256字节（2048bit）")
+            continue
+        pending_indices.append(i)
+        pending_ciphers.append(cipher_bytes)
+
+    # 合法性检查通过, 开始解密
+    message_bytes_list = RSAOAEPDecBatch(pending_ciphers, n_int, d_int, label_bytes,
+                                         hash_name=hash_info.name,
+                                         mgf1_hash_name=mgf1_hash_info.name,
+                                         e=e_int)
+    for i, message_bytes in zip(pending_indices, message_bytes_list):
+        if message_bytes is None:
+            results[i] = dict(success=False, reason="解码失败，请检查参数")
+        else:
+            results[i] = dict(success=True,
+                              message_bytes="0x" + message_bytes.hex(),
+                              message_utf8=try_decode_utf8(message_bytes))
+
+    return jsonify(success=True, results=results)
@@ -1,6 +1,117 @@
+import functools
+import math
+from typing import Union
+
+from .arith import powmod, invert
+
+DEFAULT_E = 65537
+
+
 def RSAEnc(m, n, e):
-    return pow(m, e, n)
+    return powmod(m, e, n)
+
+
+def recover_prime_factors(n: int, e: int, d: int) -> Union[tuple, None]:
+    """
+    由(n, e, d)恢复出n的两个素因子p, q
+    参考 NIST SP 800-56B Appendix C
+    失败(例如e与d不匹配)时返回None
+    """
+    k = d * e - 1
+    if k <= 0 or k % 2 == 1:
+        return None
+
+    # e与d匹配时k是λ(n)的倍数, 2^k = 1 (mod n); 先用一次模幂排除不匹配的密钥, 避免对每个底数都做完整的尝试
+    if powmod(2, k, n) != 1:
+        return None
+
+    t = (k & -k).bit_length() - 1  # k = 2^t * r, r为奇数
+    r = k >> t
+    for g in range(2, 102):
+        y = powmod(g, r, n)
+        if y == 1 or y == n - 1:
+            continue
+        for _ in range(t):
+            x = y * y % n
+            if x == 1:
+                p = math.gcd(y - 1, n)
+                q = n // p
+                if 1 < p < n and p * q == n:
+                    return p, q
+                return None
+            if x == n - 1:
+                break
+            y = x
+        else:  # 平方链始终没有到达1, g^k != 1, k不是λ(n)的倍数
+            return None
+    return None
+
+
+@functools.lru_cache(maxsize=128)
+def _crt_params(n: int, d: int, e: int, p: Union[int, None] = None, q: Union[int, None] = None):
+    """
+    计算并缓存CRT解密所需的(p, q, dP, dQ, qInv), 缓存以(n, d)等参数为键
+    无法分解n时返回None, 此时退化为直接模幂
+    """
+    if p is None or q is None:
+        factors = recover_prime_factors(n, e, d)
+        if factors is None:
+            return None
+        p, q = factors
+    elif p * q != n:
+        return None
+
+    dP = d % (p - 1)
+    dQ = d % (q - 1)
+    if dP == 0 or dQ == 0:
+        return None
+    qInv = invert(q, p)
+    return p, q, dP, dQ, qInv
+
+
+def RSADec(c, n, d, e=DEFAULT_E, p=None, q=None):
+    """
+    RSA解密, 能恢复出n的分解时使用CRT加速
+    e: 公钥指数, 用于恢复p, q; 默认为65537
+    p, q: (可选) n的素因子, 给定时无需恢复
+    """
+    params = _crt_params(n, d, e, p, q)
+    if params is None:
+        return powmod(c, d, n)
+
+    p, q, dP, dQ, qInv = params
+    m1 = powmod(c % p, dP, p)
+    m2 = powmod(c % q, dQ, q)
+    h = (qInv * (m1 - m2)) % p
+    return m2 + h * q
+
+
+def test():
+    e = DEFAULT_E
+    p = 70370393959675521820500782129455829046834624191193040774778174186390861020432999560509479154049871458971941351584959609981703698259784491166467017313830811268279206174600595835094806956703023301214538079175799918922889270950498970147750593045730876854838583096128502835448395964315594558492757738078102448063
+    q = 138546997122076233229845236559079110806642277731618790000419567680695298567304830060061354017372881645373283309640996354308746527346324698910039969835699225730201932391098735680425536942180270112225329355005519944092453869875019638296668830952322651286967291745849935332582547395526139086212637793518775176423
+    n = p * q
+    d = pow(e, -1, (p - 1) * (q - 1))
+
+    assert set(recover_prime_factors(n, e, d)) == {p, q}
+    assert recover_prime_factors(n, 3, d) is None
+
+    for m in (0, 1, 2, 123456789, n - 1):
+        c = RSAEnc(m, n, e)
+        assert RSADec(c, n, d) == m
+        assert RSADec(c, n, d, p=p, q=q) == m
+        assert RSADec(c, n, d, e=3) == m  # e不匹配时退化为直接模幂
+
 
+if __name__ == '__main__':
+    import timeit
 
-def RSADec(c, n, d):
-    return pow(c, d, n)
\ No newline at end of file
+    test()
+    _e = DEFAULT_E
+    _p = 70370393959675521820500782129455829046834624191193040774778174186390861020432999560509479154049871458971941351584959609981703698259784491166467017313830811268279206174600595835094806956703023301214538079175799918922889270950498970147750593045730876854838583096128502835448395964315594558492757738078102448063
+    _q = 138546997122076233229845236559079110806642277731618790000419567680695298567304830060061354017372881645373283309640996354308746527346324698910039969835699225730201932391098735680425536942180270112225329355005519944092453869875019638296668830952322651286967291745849935332582547395526139086212637793518775176423
+    _n = _p * _q
+    _d = pow(_e, -1, (_p - 1) * (_q - 1))
+    _c = RSAEnc(0xdeadbeef, _n, _e)
+    print("pow: ", timeit.timeit(lambda: pow(_c, _d, _n), number=50) / 50)
+    print("CRT: ", timeit.timeit(lambda: RSADec(_c, _n, _d), number=50) / 50)
@@ -1,6 +1,6 @@
 import os
 from .tools import bytes_xor, hex2
-from .rsa_raw import RSAEnc, RSADec
+from .rsa_raw import RSAEnc, RSADec, DEFAULT_E
 from .mgf import mgf1
 
 
@@ -52,9 +52,9 @@ def RSAOAEPEnc(m: bytes, n: int, e: int, r: bytes = None):
     return hex2(c_int)
 
 
-def RSAOAEPDec(c: bytes, n: int, d: int):
+def RSAOAEPDec(c: bytes, n: int, d: int, e: int = DEFAULT_E, p: int = None, q: int = None):
     c_int = int.from_bytes(c, "big")
-    plain_text_int = RSADec(c_int, n, d)
+    plain_text_int = RSADec(c_int, n, d, e, p, q)
     plain_text_bytes = plain_text_int.to_bytes(256, "big")
     msg, r_bytes = oaep_decode(plain_text_bytes)
     return msg, r_bytes
@@ -1,9 +1,11 @@
+import numpy as np
 from flask import request, abort, jsonify
 from flask_cors import cross_origin
 
 from . import main
+from .oaep_batch import simple_oaep_encode_batch
 from .rsa_simple_oaep import *
-from .tools import hex_to_bytes, try_decode_utf8
+from .tools import hex_to_bytes, hex_to_dec_int, try_decode_utf8, MAX_BATCH_SIZE
 
 
 @main.route("/crypto/simple_oaep_encode")
@@ -55,6 +57,82 @@ def simple_oaep_encode():
     return response
 
 
+@main.route("/crypto/simple_oaep_encode_batch", methods=["POST"])
+@cross_origin()
+def simple_oaep_encode_batch_route():
+    """
+    批量编码, 多条消息的掩码运算一起向量化完成
+    参数：json
+    - messages: utf8/hex 字符串列表
+    - is_message_utf8: (可选) message是否为utf8编码，默认为False
+    - rs: (可选) hex编码 字符串列表, 与messages一一对应, 默认随机生成
+
+    返回：json
+    - success: 是否成功
+    - results: 与messages顺序一致的列表, 每项包含
+        - success: 该项是否成功
+        - encoded_message: 编码后的信息，hex编码
+        - reason: 如果success=False, 失败的理由
+    - reason: 如果success=False, 失败的理由
+    :return:
+    """
+    post_data = request.get_json(silent=True)
+    if not isinstance(post_data, dict):
+        abort(400)
+
+    messages = post_data.get("messages")
+    if not isinstance(messages, list):
+        abort(400)
+    is_message_utf8 = post_data.get("is_message_utf8", "0")
+    rs = post_data.get("rs")
+
+    if len(messages) > MAX_BATCH_SIZE:
+        return jsonify(success=False, reason="单次最多处理{}条消息".format(MAX_BATCH_SIZE))
+    if rs is not None and (not isinstance(rs, list) or len(rs) != len(messages)):
+        return jsonify(success=False, reason="rs的数量与messages不一致")
+
+    # 逐条检查message与r
+    results = [None] * len(messages)
+    pending_indices = []
+    message_rows, r_rows = bytearray(), bytearray()
+    for i, message in enumerate(messages):
+        if rs is None:
+            r = os.urandom(128)
+        else:
+            r = hex_to_bytes(rs[i]) if isinstance(rs[i], str) else None
+            if r is None:
+                results[i] = dict(success=False, reason="r解析错误，请检查r是否为合法的hex字符串")
+                continue
+        if len(r) != 128:
+            results[i] = dict(success=False, reason="r的长度不等于128字节（1024bit）")
+            continue
+
+        if not isinstance(message, str):
+            results[i] = dict(success=False, reason="message不是字符串")
+            continue
+        if is_message_utf8 == "1":
+            message_bytes = bytes(message, encoding="utf8")
+        else:
+            message_bytes = hex_to_bytes(message)
+            if message_bytes is None:
+                results[i] = dict(success=False, reason="message解析错误，请检查message是否为合法的hex字符串")
+                continue
+        if len(message_bytes) > 128:  # 检查message长度
+            results[i] = dict(success=False, reason="消息长度不能大于128字节")
+            continue
+
+        pending_indices.append(i)
+        message_rows += b'\x00' * (128 - len(message_bytes)) + message_bytes  # pad
+        r_rows += r
+
+    encoded = simple_oaep_encode_batch(np.frombuffer(message_rows, dtype=np.uint8).reshape(-1, 128),
+                                       np.frombuffer(r_rows, dtype=np.uint8).reshape(-1, 128))
+    for i, row in zip(pending_indices, encoded):
+        results[i] = dict(success=True, encoded_message="0x" + row.tobytes().hex())
+
+    return jsonify(success=True, results=results)
+
+
 @main.route("/crypto/simple_oaep_decode")
 @cross_origin()
 def simple_oaep_decode():
@@ -168,6 +246,7 @@ def rsa_simple_oaep_dec():
     - cipher: hex编码的字符串
     - n: hex字符串
     - d: hex字符串
+    - e: (可选) hex字符串, 公钥指数, 用于CRT加速解密, 默认为0x010001
     - r: (可选) hex字符串
 
     返回：json
@@ -210,7 +289,16 @@ def rsa_simple_oaep_dec():
     if d_int >= n_int:
         return jsonify(success=False, reason="d >= n，请检查参数")
 
-    message_bytes, r_bytes = RSAOAEPDec(cipher_bytes, n_int, d_int)
+    # 处理e(可选)
+    e_hex = request.args.get("e")
+    if e_hex is None:
+        e_int = DEFAULT_E
+    else:
+        e_int = hex_to_dec_int(e_hex)
+        if e_int is None:
+            return jsonify(success=False, reason="e解析错误，请检查e是否为合法的hex字符串")
+
+    message_bytes, r_bytes = RSAOAEPDec(cipher_bytes, n_int, d_int, e_int)
     # 尝试解析信息为utf8
     message_utf8 = try_decode_utf8(message_bytes)
 
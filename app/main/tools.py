@@ -1,3 +1,7 @@
+# 批量接口单次请求的最大条目数
+MAX_BATCH_SIZE = 1024
+
+
 def bytes_xor(var, key, byteorder="big"):
     key, var = key[:len(var)], var[:len(key)]
     int_var = int.from_bytes(var, byteorder)
@@ -12,6 +16,8 @@ def hex2(v: int):
 
 
 def hex_to_bytes(hex_str: str):
+    if not isinstance(hex_str, str):  # json中的数字等
+        return None
     try:
         if hex_str.startswith("0x"):
             hex_str = hex_str[2:]
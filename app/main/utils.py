@@ -1,8 +1,8 @@
-import sympy
 from flask import request, abort, jsonify, make_response
 from flask_cors import cross_origin
 
 from . import main
+from .arith import next_prime, invert
 from .tools import hex_to_dec_int, hex2
 
 
@@ -22,7 +22,7 @@ def get_next_prime():
         return "argument num must be a number", 400
     try:
         num = int(num)
-        rslt = sympy.nextprime(num)
+        rslt = next_prime(num)
         result_dec = str(rslt)
         result_hex = hex2(rslt)
         return jsonify(success=True, result_dec=result_dec, result_hex=result_hex)
@@ -77,7 +77,7 @@ def calculate_inverse():
         if mod is None:
             return "mod解析错误，请检查mod是否为合法的hex字符串", 400
     try:
-        result = pow(num, -1, mod)
+        result = invert(num, mod)
         result_dec = str(result)
         result_hex = hex2(result)
         return jsonify(success=True, result_dec=result_dec, result_hex=result_hex)
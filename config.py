@@ -1,5 +1,6 @@
 bind = "0.0.0.0:5000"
 workers = 4
+threads = 16  # 每个worker的线程数, 长轮询等长连接只占用一个线程而不是整个worker
 accesslog = 'access.log'  # 访问日志目录
 errorlog = 'error.log'  # 错误日志目录
 capture_output = True  # 重定向标准输出到错误日志。默认为False。
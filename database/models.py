@@ -1,10 +1,42 @@
+import datetime
+
 from app_wrapper import db
 
 
 class Task(db.Model):
+    # 只索引未完成的任务, 查找队头任务时无需扫描全表
+    __table_args__ = (db.Index("ix_task_unfinished_id", "id",
+                               postgresql_where=db.text("NOT finished"),
+                               sqlite_where=db.text("NOT finished")),)
+
     id = db.Column(db.Integer, primary_key=True)
     g = db.Column(db.Text, index=True, nullable=False)
+    p = db.Column(db.Text)  # 模数, 本地求解的任务才有
+    y = db.Column(db.Text)  # 求log_g(y), 本地求解的任务才有
     finished = db.Column(db.Boolean, default=False)
     result = db.Column(db.Text)
     success = db.Column(db.Boolean, default=False)
     operating_time = db.Column(db.Integer, default=0)  # 操作时间
+    claimed_by = db.Column(db.Text)  # 领取该任务的实验室计算机
+    lease_expires_at = db.Column(db.DateTime, index=True)  # 租约到期时间(UTC), 到期未完成的任务可被重新领取
+
+
+class TaskStats(db.Model):
+    """任务计数, 只有一行, 随任务的发布和完成在同一事务中更新"""
+    id = db.Column(db.Integer, primary_key=True)
+    task_count = db.Column(db.Integer, nullable=False, default=0)
+    not_finished_count = db.Column(db.Integer, nullable=False, default=0)
+    head_task_id = db.Column(db.Integer)  # 编号最小的未完成任务, 没有时为NULL
+
+
+class RhoPoint(db.Model):
+    """分布式Pollard rho中上报的可区分点"""
+    __table_args__ = (db.Index("ix_rho_point_task_id_x", "task_id", "x"),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    task_id = db.Column(db.Integer, db.ForeignKey("task.id"), nullable=False)
+    x = db.Column(db.Text, nullable=False)
+    a = db.Column(db.Text, nullable=False)
+    b = db.Column(db.Text, nullable=False)
+    worker = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)